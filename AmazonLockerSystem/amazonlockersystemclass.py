@@ -2,10 +2,21 @@
 # Problem: Simulate a locker storage system with size-based allocation and expiration.
 # Concepts: Object mapping, inventory
 
+from abc import ABC, abstractmethod
+from array import array
 from enum import Enum
 from collections import defaultdict
-import random
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+import math
+import os
+import secrets
 import string
+import struct
+import sys
+import threading
+import time
 
 class LockerSize(Enum):
     SMALL = 1
@@ -18,54 +29,201 @@ class LockerStatus(Enum):
     EXPIRED = 3
 
 class Locker:
+    # __slots__ drops the per-instance __dict__, sites hold millions of these
+    __slots__ = ('locker_id', 'size', 'status', 'package', 'code', 'manager', 'expires_at')
+
     def __init__(self, locker_id, size):
         self.locker_id = locker_id
         self.size = size
         self.status = LockerStatus.AVAILABLE
         self.package = None  # Stores package object when occupied
         self.code = None  # Unique code for retrieving package
+        self.manager = None  # Set by LockerManager.add_locker so it can track free lockers
+        self.expires_at = None  # Deadline for pickup, None when the package never expires
 
-    def assign_package(self, package, code):
+    def assign_package(self, package, code, expires_at=None):
         self.status = LockerStatus.OCCUPIED
         self.package = package
         self.code = code
+        self.expires_at = expires_at
+        if self.manager:
+            self.manager.update_free_pool(self)
 
     def release_package(self):
         self.status = LockerStatus.AVAILABLE
         self.package = None
         self.code = None
+        self.expires_at = None
+        if self.manager:
+            self.manager.update_free_pool(self)
+
+    # the sweep frees the locker at once, so it never rests in LockerStatus.EXPIRED
+    def expire_package(self):
+        package = self.package
+        self.release_package()  # package goes back to the courier, locker is free again
+        return package
 
 class Package:
+    __slots__ = ('package_id', 'size')
+
     def __init__(self, package_id, size):
         self.package_id = package_id
         self.size = size
 
 class CodeGenerator:
+    ALPHABET = string.ascii_uppercase + string.digits
+    CODE_LENGTH = 6
+    CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+    PAIRS = [''.join(pair) for pair in itertools.product(ALPHABET, repeat=2)]  # a code is 3 pair lookups
+    DRAW_BYTES = 5  # 40 random bits per draw, comfortably above CODE_SPACE
+    DRAW_LIMIT = (1 << (8 * DRAW_BYTES)) // CODE_SPACE * CODE_SPACE  # reject above this to avoid modulo bias
+
+    @staticmethod
+    def generate_code(live_codes=()):
+        return CodeGenerator.generate_codes(1, live_codes)[0]
+
+    # mint `count` distinct codes that are not in live_codes, retrying on collision
+    @staticmethod
+    def generate_codes(count, live_codes=()):
+        pairs = CodeGenerator.PAIRS
+        n_pairs = len(pairs)
+        space, limit, width = CodeGenerator.CODE_SPACE, CodeGenerator.DRAW_LIMIT, CodeGenerator.DRAW_BYTES
+        codes = []
+        minted = set()
+        while len(codes) < count:
+            raw = secrets.token_bytes((count - len(codes)) * width)
+            for i in range(0, len(raw), width):
+                value = int.from_bytes(raw[i:i + width], 'big')
+                if value >= limit:
+                    continue
+                value %= space
+                code = pairs[value // (n_pairs * n_pairs)] + pairs[value // n_pairs % n_pairs] + pairs[value % n_pairs]
+                if code in minted or code in live_codes:
+                    continue
+                minted.add(code)
+                codes.append(code)
+        return codes
+
+# Allocation strategies: pick which locker size a package goes into
+class AllocationStrategy(ABC):  # interface
+    @abstractmethod
+    def choose_size(self, manager, package_size):
+        pass
+
     @staticmethod
-    def generate_code():
-        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    def fitting_sizes(package_size):
+        # a package fits its own size and anything bigger, smallest first
+        return [size for size in LockerSize if size.value >= package_size.value]
+
+class ExactSizeStrategy(AllocationStrategy):
+    def choose_size(self, manager, package_size):
+        return package_size if manager.free_count(package_size) else None
+
+class SmallestFitStrategy(AllocationStrategy):
+    def choose_size(self, manager, package_size):
+        for size in self.fitting_sizes(package_size):
+            if manager.free_count(size):
+                return size
+        return None
+
+# Fill-level aware: stay in the smallest fitting pool while taking a locker keeps it at or under `threshold`,
+# upgrade only into a bigger pool that stays under it too, so a scarce big pool is left for big packages.
+# Once every fitting pool is past the threshold it is smallest fit, so nothing free is ever refused.
+class BestFitStrategy(AllocationStrategy):
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+
+    def choose_size(self, manager, package_size):
+        fallback = None
+        for size in self.fitting_sizes(package_size):
+            free = manager.free_count(size)
+            if not free:
+                continue
+            total = len(manager.lockers[size])
+            if (total - free + 1) / total <= self.threshold:
+                return size
+            if fallback is None:
+                fallback = size
+        return fallback
 
 class LockerManager:
-    def __init__(self):
+    def __init__(self, strategy=None, ttl=None, clock=time.monotonic):
+        self.strategy = strategy or ExactSizeStrategy()
+        self.ttl = ttl  # Seconds a package may wait for pickup, None disables expiration
+        self.clock = clock
+        self.expiry_heap = []  # (deadline, code) min-heap, stale entries are skipped lazily
         self.lockers = defaultdict(list)  # Lockers grouped by size
         self.code_to_locker = {}  # Map retrieval code to Locker
+        self.free_lockers = defaultdict(dict)  # Available lockers per size, dict used as an ordered set
+        # locker -> package it holds now (None once released) for every locker changed since the last
+        # commit_journal(); None unless a subclass records changes, like PersistentLockerManager
+        self.journal = None
+        self.journal_limit = 0  # commit_journal() runs once this many lockers changed
 
     def add_locker(self, locker):
+        locker.manager = self
         self.lockers[locker.size].append(locker)
+        self.update_free_pool(locker)
+
+    # keep the free pool in sync with the locker status, O(1)
+    def update_free_pool(self, locker):
+        if locker.status == LockerStatus.AVAILABLE:
+            self.free_lockers[locker.size][locker] = None
+        else:
+            self.free_lockers[locker.size].pop(locker, None)
 
     def find_available_locker(self, package_size):
-        for locker in self.lockers[package_size]:
-            if locker.status == LockerStatus.AVAILABLE:
-                return locker
-        return None
+        pool = self.free_lockers[package_size]
+        if not pool:
+            return None
+        # popitem is O(1) (a stack pop); put it back so this stays a pure lookup
+        locker, _ = pool.popitem()
+        pool[locker] = None
+        return locker
 
-    def assign_package_to_locker(self, package):
-        locker = self.find_available_locker(package.size)
+    def free_count(self, size):
+        return len(self.free_lockers[size])
+
+    def assign_package_to_locker(self, package, ttl=None):
+        size = self.strategy.choose_size(self, package.size)
+        locker = self.find_available_locker(size) if size else None
         if not locker:
             raise Exception("No available locker for the package size.")
-        code = CodeGenerator.generate_code()
-        locker.assign_package(package, code)
+        code = CodeGenerator.generate_code(self.code_to_locker)
+        return self.place_package(locker, package, code, self.deadline(ttl))
+
+    # one code per package (None when nothing fits) instead of raising on the first failure
+    def assign_many(self, packages, ttl=None):
+        results = [None] * len(packages)
+        by_size = defaultdict(list)
+        for index, package in enumerate(packages):
+            by_size[package.size].append(index)
+        codes = iter(CodeGenerator.generate_codes(len(packages), self.code_to_locker))
+        expires_at = self.deadline(ttl)
+        # largest packages first so smaller ones cannot take the only lockers they fit in
+        for size in sorted(by_size, key=lambda size: size.value, reverse=True):
+            for index in by_size[size]:
+                chosen = self.strategy.choose_size(self, size)
+                if chosen is None:
+                    break  # nothing frees up mid-batch, so the rest of this size fails too
+                locker, _ = self.free_lockers[chosen].popitem()
+                results[index] = self.place_package(locker, packages[index], next(codes), expires_at)
+        return results
+
+    def deadline(self, ttl):
+        ttl = ttl if ttl is not None else self.ttl
+        return self.clock() + ttl if ttl is not None else None
+
+    def place_package(self, locker, package, code, expires_at):
+        locker.assign_package(package, code, expires_at)
         self.code_to_locker[code] = locker
+        if expires_at is not None:
+            heapq.heappush(self.expiry_heap, (expires_at, code))
+        journal = self.journal  # inline rather than a hook method, this is the assignment hot path
+        if journal is not None:
+            journal[locker] = package
+            if len(journal) >= self.journal_limit:
+                self.commit_journal()
         return code
 
     def retrieve_package(self, code):
@@ -74,11 +232,520 @@ class LockerManager:
         locker = self.code_to_locker[code]
         if locker.status != LockerStatus.OCCUPIED:
             raise Exception("Locker is not occupied.")
+        package = self.release_locker(locker)
+        del self.code_to_locker[code]
+        return package
+
+    # one package per code (None for invalid or already retrieved codes)
+    def retrieve_many(self, codes):
+        results = []
+        for code in codes:
+            locker = self.code_to_locker.pop(code, None)
+            if locker is None or locker.status != LockerStatus.OCCUPIED:
+                results.append(None)
+                continue
+            results.append(self.release_locker(locker))
+        return results
+
+    # pop only the deadlines that are due; returns the expired packages
+    def expire_packages(self, now=None):
+        now = self.clock() if now is None else now
+        expired = []
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            deadline, code = heapq.heappop(self.expiry_heap)
+            locker = self.code_to_locker.get(code)
+            # skip entries whose package was already retrieved or whose code was reused
+            if locker is None or locker.code != code or locker.expires_at != deadline:
+                continue
+            del self.code_to_locker[code]
+            expired.append(self.release_locker(locker))
+        return expired
+
+    # every release the manager makes (retrieval or expiry) goes through here; returns the package
+    def release_locker(self, locker):
         package = locker.package
         locker.release_package()
-        del self.code_to_locker[code]
+        journal = self.journal
+        if journal is not None:
+            journal[locker] = None
+            if len(journal) >= self.journal_limit:
+                self.commit_journal()
+        return package
+
+    def commit_journal(self):
+        self.journal = {}
+
+# Thread-safe variant: one lock per size pool plus striped locks over code_to_locker,
+# so requests for different sizes never wait on each other.
+# Lockers must only be changed through the manager, not via Locker methods directly.
+class ConcurrentLockerManager(LockerManager):
+    CODE_LOCK_STRIPES = 64
+
+    def __init__(self, strategy=None, ttl=None, clock=time.monotonic):
+        super().__init__(strategy, ttl, clock)
+        self.size_locks = {size: threading.Lock() for size in LockerSize}
+        self.code_locks = [threading.Lock() for _ in range(self.CODE_LOCK_STRIPES)]
+        self.expiry_lock = threading.Lock()  # only taken when a ttl is in use
+        for size in LockerSize:  # create every pool up front so threads never race on defaultdict inserts
+            self.lockers[size]
+            self.free_lockers[size]
+
+    def code_lock(self, code):
+        return self.code_locks[hash(code) % self.CODE_LOCK_STRIPES]
+
+    def add_locker(self, locker):
+        with self.size_locks[locker.size]:
+            super().add_locker(locker)
+
+    def find_available_locker(self, package_size):
+        with self.size_locks[package_size]:
+            return super().find_available_locker(package_size)
+
+    # claim a code nobody else holds; the None placeholder keeps other threads from minting it
+    def reserve_code(self):
+        while True:
+            code = CodeGenerator.generate_code(self.code_to_locker)
+            with self.code_lock(code):
+                if code not in self.code_to_locker:
+                    self.code_to_locker[code] = None
+                    return code
+
+    def assign_package_to_locker(self, package, ttl=None):
+        code = self.reserve_code()
+        expires_at = self.deadline(ttl)
+        locker = None
+        while locker is None:
+            size = self.strategy.choose_size(self, package.size)
+            if size is None:
+                with self.code_lock(code):
+                    del self.code_to_locker[code]
+                raise Exception("No available locker for the package size.")
+            with self.size_locks[size]:
+                pool = self.free_lockers[size]
+                if pool:  # otherwise another thread took the last one, choose again
+                    locker, _ = pool.popitem()
+                    locker.assign_package(package, code, expires_at)
+        with self.code_lock(code):
+            self.code_to_locker[code] = locker
+        if expires_at is not None:
+            with self.expiry_lock:
+                heapq.heappush(self.expiry_heap, (expires_at, code))
+        return code
+
+    def assign_many(self, packages, ttl=None):
+        results = [None] * len(packages)
+        order = sorted(range(len(packages)), key=lambda index: packages[index].size.value, reverse=True)
+        for index in order:
+            try:
+                results[index] = self.assign_package_to_locker(packages[index], ttl)
+            except Exception:
+                pass
+        return results
+
+    def retrieve_package(self, code):
+        with self.code_lock(code):
+            locker = self.code_to_locker.get(code)
+            if locker is None:
+                raise Exception("Invalid code or package already retrieved.")
+            del self.code_to_locker[code]
+        with self.size_locks[locker.size]:
+            if locker.status != LockerStatus.OCCUPIED:
+                raise Exception("Locker is not occupied.")
+            package = locker.package
+            locker.release_package()
+        return package
+
+    def retrieve_many(self, codes):
+        results = []
+        for code in codes:
+            try:
+                results.append(self.retrieve_package(code))
+            except Exception:
+                results.append(None)
+        return results
+
+    def expire_packages(self, now=None):
+        now = self.clock() if now is None else now
+        due = []
+        with self.expiry_lock:
+            while self.expiry_heap and self.expiry_heap[0][0] <= now:
+                due.append(heapq.heappop(self.expiry_heap))
+        expired = []
+        for deadline, code in due:
+            with self.code_lock(code):
+                locker = self.code_to_locker.get(code)
+                if locker is None or locker.code != code or locker.expires_at != deadline:
+                    continue
+                del self.code_to_locker[code]
+            with self.size_locks[locker.size]:
+                expired.append(locker.expire_package())
+        return expired
+
+# Multi-site federation: many LockerManagers, each at a map position
+class LockerSite:
+    def __init__(self, site_id, x, y, manager=None):
+        self.site_id = site_id
+        self.x = x
+        self.y = y
+        self.manager = manager or LockerManager()
+
+# Routes packages to the nearest site with room. Sites are bucketed in a grid per LockerSize and
+# only sites with free lockers of that size sit in the buckets, so routing walks grid rings outward
+# instead of scanning every site. Codes look like "<site_id>-<local code>".
+# Expiry sweeps only visit sites whose earliest deadline has passed, via a heap of (deadline, site).
+class LockerFederation:
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.sites = {}  # site_id -> LockerSite
+        self.sites_by_code = {}  # str(site_id), the prefix in codes -> LockerSite
+        self.expiry_sites = []  # (earliest deadline, seq, site) min-heap, stale entries skipped lazily
+        self.site_deadline = {}  # site_id -> deadline of its live expiry_sites entry
+        self.expiry_seq = itertools.count()
+        self.free_sites = {size: {} for size in LockerSize}  # size -> cell -> sites with free lockers
+        self.min_cell = None
+        self.max_cell = None
+
+    def cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def add_site(self, site):
+        prefix = str(site.site_id)
+        if site.site_id in self.sites or prefix in self.sites_by_code:
+            raise ValueError(f"Site {site.site_id!r} is already in the federation")
+        self.sites[site.site_id] = site
+        self.sites_by_code[prefix] = site
+        cx, cy = self.cell(site.x, site.y)
+        if self.min_cell is None:
+            self.min_cell, self.max_cell = (cx, cy), (cx, cy)
+        else:
+            self.min_cell = (min(self.min_cell[0], cx), min(self.min_cell[1], cy))
+            self.max_cell = (max(self.max_cell[0], cx), max(self.max_cell[1], cy))
+        self.refresh_site(site)
+
+    def add_locker(self, site_id, locker):
+        site = self.sites[site_id]
+        site.manager.add_locker(locker)
+        self.refresh_site(site)
+
+    # re-bucket a site after its free counts changed, O(number of sizes)
+    def refresh_site(self, site):
+        cell = self.cell(site.x, site.y)
+        for size in LockerSize:
+            buckets = self.free_sites[size]
+            if site.manager.free_count(size):
+                buckets.setdefault(cell, set()).add(site)
+            elif cell in buckets:
+                buckets[cell].discard(site)
+                if not buckets[cell]:
+                    del buckets[cell]
+
+    @staticmethod
+    def ring_cells(cx, cy, ring):
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
+
+    # ring walk outwards from the query cell; once it has touched more cells than there are cells with a
+    # fitting free site (a miss, a far-away point, sparse sites) those cells are scanned directly instead
+    def find_nearest_site(self, x, y, package_size):
+        sizes = AllocationStrategy.fitting_sizes(package_size)
+        occupied_cells = sum(len(self.free_sites[size]) for size in sizes)
+        if not occupied_cells:
+            return None
+        cx, cy = self.cell(x, y)
+        last_ring = max(cx - self.min_cell[0], self.max_cell[0] - cx, cy - self.min_cell[1], self.max_cell[1] - cy, 0)
+        best_site, best_distance = None, None
+        visited = 0
+        for ring in range(last_ring + 1):
+            # every cell in this ring is at least (ring - 1) cells away, nothing closer can follow
+            if best_site is not None and (ring - 1) * self.cell_size >= best_distance:
+                break
+            visited += 8 * ring or 1
+            if visited > occupied_cells:
+                return self.scan_sites(x, y, package_size, sizes)
+            for cell in self.ring_cells(cx, cy, ring):
+                for size in sizes:
+                    for site in self.free_sites[size].get(cell, ()):
+                        distance = math.hypot(site.x - x, site.y - y)
+                        if best_distance is not None and distance >= best_distance:
+                            continue
+                        if site.manager.strategy.choose_size(site.manager, package_size):
+                            best_site, best_distance = site, distance
+        return best_site
+
+    # nearest accepting site among every cell holding a fitting free site, O(those sites)
+    def scan_sites(self, x, y, package_size, sizes):
+        best_site, best_distance = None, None
+        for size in sizes:
+            for sites in self.free_sites[size].values():
+                for site in sites:
+                    distance = math.hypot(site.x - x, site.y - y)
+                    if best_distance is not None and distance >= best_distance:
+                        continue
+                    if site.manager.strategy.choose_size(site.manager, package_size):
+                        best_site, best_distance = site, distance
+        return best_site
+
+    def assign_package_to_locker(self, package, x, y, ttl=None):
+        site = self.find_nearest_site(x, y, package.size)
+        if not site:
+            raise Exception("No available locker for the package size.")
+        code = site.manager.assign_package_to_locker(package, ttl)
+        self.refresh_site(site)
+        self.schedule_expiry(site)
+        return f"{site.site_id}-{code}"
+
+    # (re)queue a site under its earliest deadline, if that moved earlier than the queued one
+    def schedule_expiry(self, site):
+        expiry_heap = site.manager.expiry_heap
+        if not expiry_heap:
+            return
+        earliest = expiry_heap[0][0]
+        queued = self.site_deadline.get(site.site_id)
+        if queued is None or earliest < queued:
+            self.site_deadline[site.site_id] = earliest
+            heapq.heappush(self.expiry_sites, (earliest, next(self.expiry_seq), site))
+
+    def retrieve_package(self, code):
+        prefix, _, local_code = code.rpartition('-')
+        site = self.sites_by_code.get(prefix)
+        if not site:
+            raise Exception("Invalid code or package already retrieved.")
+        package = site.manager.retrieve_package(local_code)
+        self.refresh_site(site)
         return package
 
+    def expire_packages(self, now=None):
+        expired = []
+        while self.expiry_sites:
+            deadline, _, site = self.expiry_sites[0]
+            if deadline > (site.manager.clock() if now is None else now):
+                break
+            heapq.heappop(self.expiry_sites)
+            if self.site_deadline.get(site.site_id) != deadline:
+                continue  # superseded by an earlier deadline for the same site
+            del self.site_deadline[site.site_id]
+            expired.extend(site.manager.expire_packages(now))
+            self.refresh_site(site)
+            self.schedule_expiry(site)
+        return expired
+
+# Persistence: append-only write-ahead log of locker states plus compact binary snapshots.
+# Recovery only needs each locker's latest state, so assignments and releases just land in the journal;
+# every `group_commit` changed lockers (or on flush()) commit_journal() writes a group: an ADD per new locker,
+# a RELEASE per locker now free and an ASSIGN with the current package of every other journaled locker.
+# The group is fsync'd on a background thread while assignments go on, and the next commit waits for that
+# fsync first, so a crash loses at most the group being filled and the one being synced; flush() and close()
+# return once everything is on disk. A torn group at the end of the log is dropped on recovery.
+# A group is a header, the ADD and ASSIGN sizes, the ASSIGN deadlines, then every string (ADD ids, RELEASE ids,
+# ASSIGN locker ids, package ids, codes) as one NUL-separated UTF-8 blob. Columns are built straight from the
+# lockers, there is no per-event record or encoding loop; ids that contain NUL get an explicit length column.
+# Snapshots are a single group of ADD (every locker) and ASSIGN (every occupied locker) events.
+# Lockers must only be changed through the manager, not via Locker methods directly.
+# Locker and package ids are stored as str() and come back as strings.
+# Use a wall clock (time.time) with a ttl, deadlines are stored as-is.
+class PersistentLockerManager(LockerManager):
+    FILE_HEAD = struct.Struct('<8sQ')  # magic, generation
+    GROUP_HEAD = struct.Struct('<IIII?')  # adds, releases, assigns, blob bytes, string lengths stored
+    WAL_MAGIC = b'LKRWAL03'
+    SNAPSHOT_MAGIC = b'LKRSNP03'
+    NO_DEADLINE = float('nan')
+    SIZES = {size.value: size for size in LockerSize}
+
+    def __init__(self, directory, strategy=None, ttl=None, clock=time.time, group_commit=512, snapshot_every=None):
+        super().__init__(strategy, ttl, clock)
+        self.wal_path = os.path.join(directory, 'lockers.wal')
+        self.snapshot_path = os.path.join(directory, 'lockers.snapshot')
+        self.snapshot_every = snapshot_every  # events between automatic snapshots, None for manual only
+        self.locker_by_id = {}  # keyed by str(locker_id), the form ids take in the log
+        self.added = []  # lockers not yet in the log
+        self.events_since_snapshot = 0
+        self.generation = 0  # bumped by every snapshot, the log carries the generation it follows
+        self.syncer = ThreadPoolExecutor(max_workers=1)
+        self.pending_sync = None  # fsync of the last committed group, None once it is known to be done
+        self.recover()  # no journal yet, so nothing replayed is logged again
+        self.journal, self.journal_limit = {}, group_commit
+        self.wal = open(self.wal_path, 'ab')
+        if self.wal.tell() == 0:
+            self.wal.write(self.FILE_HEAD.pack(self.WAL_MAGIC, self.generation))
+            self.sync()
+
+    # lockers recovered from disk are already registered, adding one again would duplicate it in every pool
+    def add_locker(self, locker):
+        locker_id = str(locker.locker_id)
+        if locker_id in self.locker_by_id:
+            raise ValueError(f"Locker {locker_id} already exists.")
+        self.locker_by_id[locker_id] = locker
+        super().add_locker(locker)
+        if self.journal is not None:
+            self.added.append(locker)
+            if len(self.added) >= self.journal_limit:
+                self.commit_journal()
+
+    def commit_journal(self):
+        if not self.added and not self.journal:
+            return
+        self.wal.write(self.encode_group(self.added, self.journal))
+        self.events_since_snapshot += len(self.added) + len(self.journal)
+        self.added, self.journal = [], {}
+        self.wal.flush()
+        self.wait_for_sync()
+        self.pending_sync = self.syncer.submit(os.fsync, self.wal.fileno())
+        if self.snapshot_every and self.events_since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    # raises the OSError if the last group's fsync failed
+    def wait_for_sync(self):
+        if self.pending_sync is not None:
+            pending, self.pending_sync = self.pending_sync, None
+            pending.result()
+
+    def flush(self):
+        self.commit_journal()
+        self.wait_for_sync()
+
+    def sync(self):
+        self.wal.flush()
+        os.fsync(self.wal.fileno())
+
+    def close(self):
+        self.flush()
+        self.syncer.shutdown()
+        self.wal.close()
+
+    # the one place records are built, for log groups and snapshots alike: every column is one comprehension
+    # over the lockers. size is the raw enum value, Enum.value is a slow descriptor.
+    def encode_group(self, added, journal):
+        released, assigned = (), journal
+        packages = list(filter(None, journal.values()))
+        if len(packages) < len(journal):  # some lockers were left free
+            released = [locker for locker, package in journal.items() if package is None]
+            assigned = [locker for locker, package in journal.items() if package is not None]
+        strings = [locker.locker_id for locker in added]
+        strings += [locker.locker_id for locker in released]
+        strings += [locker.locker_id for locker in assigned]
+        strings += [package.package_id for package in packages]
+        strings += [locker.code for locker in assigned]
+        sizes = bytes([locker.size._value_ for locker in added] + [package.size._value_ for package in packages])
+        deadlines = [locker.expires_at for locker in assigned]
+        no_deadline = deadlines.count(None)  # stored as NaN
+        if no_deadline == len(deadlines):
+            deadlines = array('d', [self.NO_DEADLINE]) * no_deadline
+        elif no_deadline:
+            deadlines = array('d', [self.NO_DEADLINE if expires_at is None else expires_at for expires_at in deadlines])
+        else:
+            deadlines = array('d', deadlines)
+        try:
+            text = '\0'.join(strings)
+        except TypeError:  # non-string ids are rare, only then pay for str() on every id
+            strings = list(map(str, strings))
+            text = '\0'.join(strings)
+        blob, lengths = text.encode(), array('H')
+        if blob.count(0) != len(strings) - 1:  # an id holds a NUL itself, store lengths rather than separators
+            blob, lengths = ''.join(strings).encode(), array('H', map(len, strings))
+        if sys.byteorder == 'big':
+            deadlines.byteswap()
+            lengths.byteswap()
+        head = self.GROUP_HEAD.pack(len(added), len(released), len(assigned), len(blob), len(lengths) > 0)
+        return head + sizes + deadlines.tobytes() + lengths.tobytes() + blob
+
+    # write a new snapshot, then start a fresh log for the next generation
+    def snapshot(self):
+        self.flush()
+        self.generation += 1
+        lockers = self.locker_by_id.values()
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(self.FILE_HEAD.pack(self.SNAPSHOT_MAGIC, self.generation))
+            occupied = {locker: locker.package for locker in lockers if locker.package is not None}
+            f.write(self.encode_group(lockers, occupied))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        # a crash before the truncate leaves an older-generation log, which recovery ignores
+        self.wal.truncate(0)
+        self.wal.write(self.FILE_HEAD.pack(self.WAL_MAGIC, self.generation))
+        self.sync()
+        self.events_since_snapshot = 0
+
+    def recover(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                data = f.read()
+            magic, self.generation = self.FILE_HEAD.unpack_from(data)
+            if magic != self.SNAPSHOT_MAGIC or self.replay(data, self.FILE_HEAD.size) != len(data):
+                raise Exception("Corrupt locker snapshot.")
+        if os.path.exists(self.wal_path):
+            with open(self.wal_path, 'rb') as f:
+                data = f.read()
+            if len(data) >= self.FILE_HEAD.size:
+                magic, generation = self.FILE_HEAD.unpack_from(data)
+                if magic != self.WAL_MAGIC:
+                    raise Exception("Corrupt write-ahead log.")
+                if generation == self.generation:
+                    end = self.replay(data, self.FILE_HEAD.size)
+                    if end < len(data):  # drop a torn group from a crash mid-write
+                        with open(self.wal_path, 'r+b') as f:
+                            f.truncate(end)
+                    return
+            # missing header or a log from before the latest snapshot: start a fresh one
+            open(self.wal_path, 'wb').close()
+
+    # another locker may hold the code by now, codes are reused once released
+    def forget_code(self, locker):
+        if locker.code is not None and self.code_to_locker.get(locker.code) is locker:
+            del self.code_to_locker[locker.code]
+
+    # apply every complete group from offset on, returns where the last complete group ends
+    def replay(self, data, offset):
+        group_head, sizes, lockers = self.GROUP_HEAD, self.SIZES, self.locker_by_id
+        while offset + group_head.size <= len(data):
+            adds, releases, assigns, blob_size, has_lengths = group_head.unpack_from(data, offset)
+            count = adds + releases + 3 * assigns
+            start = offset + group_head.size
+            deadlines_start = start + adds + assigns
+            blob_start = deadlines_start + 8 * assigns + (2 * count if has_lengths else 0)
+            end = blob_start + blob_size
+            if end > len(data):
+                break
+            event_sizes = data[start:deadlines_start]
+            deadlines, lengths = array('d'), array('H')
+            deadlines.frombytes(data[deadlines_start:deadlines_start + 8 * assigns])
+            lengths.frombytes(data[deadlines_start + 8 * assigns:blob_start])
+            if sys.byteorder == 'big':
+                deadlines.byteswap()
+                lengths.byteswap()
+            text = data[blob_start:end].decode()
+            if has_lengths:
+                ends = list(itertools.accumulate(lengths))
+                strings = [text[i:j] for i, j in zip([0] + ends[:-1], ends)]
+            else:
+                strings = text.split('\0') if count else []
+            if len(strings) != count:
+                raise Exception("Corrupt write-ahead log.")
+            for i in range(adds):
+                self.add_locker(Locker(strings[i], sizes[event_sizes[i]]))
+            for locker_id in strings[adds:adds + releases]:
+                locker = lockers[locker_id]
+                self.forget_code(locker)
+                locker.release_package()
+            # the blob holds every ASSIGN locker id, then every package id, then every code
+            first = adds + releases
+            for i in range(assigns):
+                locker = lockers[strings[first + i]]
+                package = Package(strings[first + assigns + i], sizes[event_sizes[adds + i]])
+                expires_at = None if math.isnan(deadlines[i]) else deadlines[i]
+                self.forget_code(locker)  # a locker's last state replaces whatever it held before
+                self.place_package(locker, package, strings[first + 2 * assigns + i], expires_at)
+            offset = end
+        return offset
+
 # Example usage:
 if __name__ == "__main__":
     # Initialize lockers
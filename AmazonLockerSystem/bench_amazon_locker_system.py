@@ -0,0 +1,157 @@
+# Benchmarks for the Amazon Locker System
+# Run: python bench_amazon_locker_system.py
+
+import gc
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from amazonlockersystemclass import (CodeGenerator, ConcurrentLockerManager, Locker, LockerFederation, LockerManager,
+                                     LockerSite, LockerSize, Package, PersistentLockerManager)
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def bench_code_generation():
+    print("== Code generation ==")
+    _, elapsed = timed(lambda: [CodeGenerator.generate_code() for _ in range(100_000)])
+    print(f"generate_code:          {100_000 / elapsed:,.0f} codes/sec")
+    live, elapsed = timed(lambda: set(CodeGenerator.generate_codes(1_000_000)))
+    print(f"generate_codes(1M):     {1_000_000 / elapsed:,.0f} codes/sec")
+    batch, elapsed = timed(lambda: CodeGenerator.generate_codes(100_000, live))
+    print(f"batch vs 1M live codes: {100_000 / elapsed:,.0f} codes/sec, collisions: {len(live.intersection(batch))}")
+
+def build_manager(lockers_per_size, manager_class=LockerManager):
+    manager = manager_class()
+    for size in LockerSize:
+        for i in range(lockers_per_size):
+            manager.add_locker(Locker(f"{size.name}{i}", size))
+    return manager
+
+def bench_bulk_assignment():
+    print("== Bulk assignment ==")
+    for batch in (1_000, 10_000, 100_000):
+        packages = [Package(f"P{i}", list(LockerSize)[i % 3]) for i in range(batch)]
+        manager = build_manager(batch)
+        _, single = timed(lambda: [manager.assign_package_to_locker(p) for p in packages])
+        manager = build_manager(batch)
+        codes, bulk = timed(lambda: manager.assign_many(packages))
+        _, retrieve = timed(lambda: manager.retrieve_many(codes))
+        print(f"{batch:>7,} packages: one-by-one {batch / single:,.0f}/sec, "
+              f"assign_many {batch / bulk:,.0f}/sec, retrieve_many {batch / retrieve:,.0f}/sec")
+
+def bench_concurrent_manager(ops_per_thread=20_000):
+    print("== ConcurrentLockerManager (assign + retrieve pairs) ==")
+    for n_threads in (1, 4, 16):
+        manager = build_manager(1_000, ConcurrentLockerManager)
+
+        def worker(worker_id):
+            size = list(LockerSize)[worker_id % 3]
+            for i in range(ops_per_thread):
+                code = manager.assign_package_to_locker(Package(f"W{worker_id}-{i}", size))
+                manager.retrieve_package(code)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(n_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        print(f"{n_threads:>2} threads: {2 * ops_per_thread * n_threads / elapsed:,.0f} ops/sec")
+
+# The Locker/Package layout before __slots__, kept here as the memory baseline
+class DictLocker:
+    def __init__(self, locker_id, size):
+        self.locker_id = locker_id
+        self.size = size
+        self.status = None
+        self.package = None
+        self.code = None
+        self.manager = None
+        self.expires_at = None
+
+class DictPackage:
+    def __init__(self, package_id, size):
+        self.package_id = package_id
+        self.size = size
+
+def traced_bytes(build):
+    tracemalloc.start()
+    objects = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size
+
+def bench_memory(count=1_000_000):
+    print("== Memory at 1M lockers + 1M packages ==")
+    ids = [f"L{i}" for i in range(count)]  # shared ids so only the objects are measured
+    for label, locker_class, package_class in (("__dict__", DictLocker, DictPackage),
+                                               ("__slots__", Locker, Package)):
+        size = traced_bytes(lambda: ([locker_class(i, LockerSize.SMALL) for i in ids],
+                                     [package_class(i, LockerSize.SMALL) for i in ids]))
+        print(f"{label:>9}: {size / 2**20:,.1f} MiB ({size / count:.0f} bytes per locker + package)")
+
+def bench_federation_routing(n_sites=2_000, n_packages=10_000):
+    print(f"== Federation routing over {n_sites:,} sites ==")
+    rng = random.Random(1)
+    federation = LockerFederation(cell_size=10.0)
+    for i in range(n_sites):
+        federation.add_site(LockerSite(f"S{i}", rng.uniform(0, 1000), rng.uniform(0, 1000)))
+        for j in range(10):
+            federation.add_locker(f"S{i}", Locker(f"S{i}-{j}", LockerSize.SMALL))
+    points = [(rng.uniform(0, 1000), rng.uniform(0, 1000)) for _ in range(n_packages)]
+    _, elapsed = timed(lambda: [federation.assign_package_to_locker(Package("P", LockerSize.SMALL), x, y)
+                                for x, y in points])
+    print(f"assign with routing: {n_packages / elapsed:,.0f}/sec ({n_packages / (n_sites * 10):.0%} of lockers filled)")
+
+def fill_manager(manager, n_lockers):
+    for i in range(n_lockers):
+        manager.add_locker(Locker(f"L{i}", LockerSize.SMALL))
+    return manager
+
+def bench_persistence(n_lockers=1_000_000, rounds=3, batch=10_000):
+    print(f"== Write-ahead log and recovery at {n_lockers:,} lockers ==")
+    packages = [Package(f"P{i}", LockerSize.SMALL) for i in range(n_lockers // 2)]
+    batches = [packages[i:i + batch] for i in range(0, len(packages), batch)]
+    best = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(rounds):
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            managers = {"plain": fill_manager(LockerManager(), n_lockers),
+                        "logged": fill_manager(PersistentLockerManager(directory, group_commit=4096), n_lockers)}
+            managers["logged"].snapshot()
+            gc.collect()  # lockers and their manager form cycles, don't bill one round's garbage to the next
+            # both managers live side by side and take turns per batch, so drift on a busy machine hits them
+            # alike; each batch keeps its best time over the rounds
+            for i, chunk in enumerate(batches):
+                for name in sorted(managers, reverse=i % 2 == 1):
+                    manager = managers[name]
+                    elapsed = timed(lambda: [manager.assign_package_to_locker(p) for p in chunk])[1]
+                    best[name, i] = min(best.get((name, i), elapsed), elapsed)
+            managers["logged"].close()
+            del managers
+        plain = sum(best["plain", i] for i in range(len(batches)))
+        logged = sum(best["logged", i] for i in range(len(batches)))
+        print(f"assign: {len(packages) / plain:,.0f}/sec plain, {len(packages) / logged:,.0f}/sec logged "
+              f"({logged / plain - 1:+.0%} logging overhead)")
+        recovered, elapsed = timed(lambda: PersistentLockerManager(directory))
+        print(f"recovery (snapshot of {n_lockers:,} lockers + {len(packages):,} log records): {elapsed:.2f}s")
+        recovered.snapshot()
+        recovered.close()
+        _, elapsed = timed(lambda: PersistentLockerManager(directory).close())
+        print(f"recovery (snapshot only, {len(packages):,} occupied): {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    bench_code_generation()
+    bench_bulk_assignment()
+    bench_concurrent_manager()
+    bench_memory()
+    bench_federation_routing()
+    bench_persistence()
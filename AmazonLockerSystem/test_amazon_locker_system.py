@@ -0,0 +1,511 @@
+import os
+import random
+import tempfile
+import threading
+import time
+import unittest
+from amazonlockersystemclass import (BestFitStrategy, CodeGenerator, ConcurrentLockerManager, ExactSizeStrategy,
+                                     Locker, LockerFederation, LockerManager, LockerSite, LockerSize, LockerStatus,
+                                     Package, PersistentLockerManager, SmallestFitStrategy)
+
+
+class TestAmazonLockerSystem(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = LockerManager()
+
+    def add_lockers(self, size, count, prefix="L"):
+        lockers = [Locker(f"{prefix}{size.name}{i}", size) for i in range(count)]
+        for locker in lockers:
+            self.manager.add_locker(locker)
+        return lockers
+
+    def test_01_assign_and_retrieve(self):
+        self.add_lockers(LockerSize.SMALL, 1)
+        package = Package("P1", LockerSize.SMALL)
+        code = self.manager.assign_package_to_locker(package)
+        self.assertIs(self.manager.retrieve_package(code), package)
+
+    def test_02_free_pool_tracks_assign_and_release(self):
+        lockers = self.add_lockers(LockerSize.MEDIUM, 3)
+        self.assertEqual(len(self.manager.free_lockers[LockerSize.MEDIUM]), 3)
+        code = self.manager.assign_package_to_locker(Package("P1", LockerSize.MEDIUM))
+        self.assertEqual(len(self.manager.free_lockers[LockerSize.MEDIUM]), 2)
+        self.manager.retrieve_package(code)
+        self.assertEqual(len(self.manager.free_lockers[LockerSize.MEDIUM]), 3)
+        self.assertTrue(all(locker.status == LockerStatus.AVAILABLE for locker in lockers))
+
+    def test_03_free_pool_tracks_direct_locker_calls(self):
+        locker = self.add_lockers(LockerSize.LARGE, 1)[0]
+        locker.assign_package(Package("P1", LockerSize.LARGE), "CODE01")
+        self.assertIsNone(self.manager.find_available_locker(LockerSize.LARGE))
+        locker.release_package()
+        self.assertIs(self.manager.find_available_locker(LockerSize.LARGE), locker)
+
+    def test_04_find_available_locker_does_not_reserve(self):
+        locker = self.add_lockers(LockerSize.SMALL, 1)[0]
+        self.assertIs(self.manager.find_available_locker(LockerSize.SMALL), locker)
+        self.assertIs(self.manager.find_available_locker(LockerSize.SMALL), locker)
+
+    def test_05_fill_every_locker(self):
+        lockers = self.add_lockers(LockerSize.SMALL, 50)
+        codes = [self.manager.assign_package_to_locker(Package(f"P{i}", LockerSize.SMALL)) for i in range(50)]
+        self.assertTrue(all(locker.status == LockerStatus.OCCUPIED for locker in lockers))
+        with self.assertRaises(Exception):
+            self.manager.assign_package_to_locker(Package("P50", LockerSize.SMALL))
+        self.manager.retrieve_package(codes[10])
+        self.manager.assign_package_to_locker(Package("P51", LockerSize.SMALL))
+
+    def test_06_no_locker_of_size(self):
+        with self.assertRaises(Exception):
+            self.manager.assign_package_to_locker(Package("P1", LockerSize.LARGE))
+
+    def test_07_exact_strategy_does_not_upgrade(self):
+        self.manager = LockerManager(ExactSizeStrategy())
+        self.add_lockers(LockerSize.LARGE, 1)
+        with self.assertRaises(Exception):
+            self.manager.assign_package_to_locker(Package("P1", LockerSize.SMALL))
+
+    def test_08_smallest_fit_upgrades_to_next_size(self):
+        self.manager = LockerManager(SmallestFitStrategy())
+        self.add_lockers(LockerSize.SMALL, 1)
+        medium = self.add_lockers(LockerSize.MEDIUM, 1)[0]
+        self.add_lockers(LockerSize.LARGE, 1)
+        self.manager.assign_package_to_locker(Package("P1", LockerSize.SMALL))
+        code = self.manager.assign_package_to_locker(Package("P2", LockerSize.SMALL))
+        self.assertIs(self.manager.code_to_locker[code], medium)
+
+    def test_09_smallest_fit_never_downgrades(self):
+        self.manager = LockerManager(SmallestFitStrategy())
+        self.add_lockers(LockerSize.SMALL, 2)
+        with self.assertRaises(Exception):
+            self.manager.assign_package_to_locker(Package("P1", LockerSize.MEDIUM))
+
+    def test_10_best_fit_upgrades_once_the_pool_passes_its_threshold(self):
+        self.manager = LockerManager(BestFitStrategy())
+        self.add_lockers(LockerSize.SMALL, 2)
+        self.add_lockers(LockerSize.MEDIUM, 4)
+        first = self.manager.assign_package_to_locker(Package("P1", LockerSize.SMALL))
+        self.assertEqual(self.manager.code_to_locker[first].size, LockerSize.SMALL)
+        # another SMALL would fill it past 80% while MEDIUM stays well under, so it goes to MEDIUM
+        second = self.manager.assign_package_to_locker(Package("P2", LockerSize.SMALL))
+        self.assertEqual(self.manager.code_to_locker[second].size, LockerSize.MEDIUM)
+        self.assertEqual(self.manager.free_count(LockerSize.SMALL), 1)
+        self.assertEqual(self.manager.free_count(LockerSize.MEDIUM), 3)
+
+    def test_11_expire_packages_after_ttl(self):
+        now = [0.0]
+        self.manager = LockerManager(ttl=60, clock=lambda: now[0])
+        locker = self.add_lockers(LockerSize.SMALL, 1)[0]
+        package = Package("P1", LockerSize.SMALL)
+        code = self.manager.assign_package_to_locker(package)
+        now[0] = 59
+        self.assertEqual(self.manager.expire_packages(), [])
+        now[0] = 60
+        self.assertEqual(self.manager.expire_packages(), [package])
+        self.assertNotIn(code, self.manager.code_to_locker)
+        self.assertEqual(locker.status, LockerStatus.AVAILABLE)
+        self.assertIs(self.manager.find_available_locker(LockerSize.SMALL), locker)
+        with self.assertRaises(Exception):
+            self.manager.retrieve_package(code)
+
+    def test_12_expire_skips_retrieved_packages(self):
+        now = [0.0]
+        self.manager = LockerManager(ttl=10, clock=lambda: now[0])
+        self.add_lockers(LockerSize.SMALL, 2)
+        code1 = self.manager.assign_package_to_locker(Package("P1", LockerSize.SMALL))
+        self.manager.assign_package_to_locker(Package("P2", LockerSize.SMALL), ttl=100)
+        self.manager.retrieve_package(code1)
+        now[0] = 50
+        self.assertEqual(self.manager.expire_packages(), [])
+        self.assertEqual(len(self.manager.expiry_heap), 1)
+        self.assertEqual([p.package_id for p in self.manager.expire_packages(now=100)], ["P2"])
+
+    def test_13_no_ttl_never_expires(self):
+        self.add_lockers(LockerSize.SMALL, 1)
+        code = self.manager.assign_package_to_locker(Package("P1", LockerSize.SMALL))
+        self.assertEqual(self.manager.expire_packages(now=float("inf")), [])
+        self.assertIn(code, self.manager.code_to_locker)
+
+    def test_14_generate_code_format(self):
+        code = CodeGenerator.generate_code()
+        self.assertEqual(len(code), 6)
+        self.assertTrue(all(ch in CodeGenerator.ALPHABET for ch in code))
+
+    def test_15_generate_code_avoids_live_codes(self):
+        # every code ending in AAAA is live
+        live = {pair + "AA" + "AA" for pair in CodeGenerator.PAIRS}
+        code = CodeGenerator.generate_code(live)
+        self.assertNotIn(code, live)
+
+    def test_16_no_collisions_at_1m_live_codes(self):
+        live = set(CodeGenerator.generate_codes(1_000_000))
+        self.assertEqual(len(live), 1_000_000)
+        batch = CodeGenerator.generate_codes(10_000, live)
+        self.assertEqual(len(set(batch)), 10_000)
+        self.assertTrue(live.isdisjoint(batch))
+
+    def test_17_manager_codes_are_unique(self):
+        self.add_lockers(LockerSize.SMALL, 1000)
+        codes = {self.manager.assign_package_to_locker(Package(f"P{i}", LockerSize.SMALL)) for i in range(1000)}
+        self.assertEqual(len(codes), 1000)
+        self.assertEqual(set(self.manager.code_to_locker), codes)
+
+    def test_18_assign_many_partial_failure(self):
+        self.add_lockers(LockerSize.SMALL, 2)
+        self.add_lockers(LockerSize.LARGE, 1)
+        packages = [Package(f"P{i}", LockerSize.SMALL) for i in range(3)] + [Package("P3", LockerSize.LARGE)]
+        codes = self.manager.assign_many(packages)
+        self.assertEqual(len(codes), 4)
+        self.assertIsNotNone(codes[0])
+        self.assertIsNotNone(codes[1])
+        self.assertIsNone(codes[2])
+        self.assertIs(self.manager.code_to_locker[codes[3]].package, packages[3])
+        self.assertEqual(self.manager.free_count(LockerSize.SMALL), 0)
+
+    def test_19_assign_many_fills_large_packages_first(self):
+        self.manager = LockerManager(SmallestFitStrategy())
+        self.add_lockers(LockerSize.LARGE, 1)
+        codes = self.manager.assign_many([Package("P1", LockerSize.SMALL), Package("P2", LockerSize.LARGE)])
+        self.assertIsNone(codes[0])
+        self.assertIsNotNone(codes[1])
+
+    def test_20_retrieve_many(self):
+        self.add_lockers(LockerSize.MEDIUM, 3)
+        packages = [Package(f"P{i}", LockerSize.MEDIUM) for i in range(3)]
+        codes = self.manager.assign_many(packages)
+        results = self.manager.retrieve_many([codes[2], "BOGUS1", codes[0], codes[2]])
+        self.assertEqual(results, [packages[2], None, packages[0], None])
+        self.assertEqual(self.manager.free_count(LockerSize.MEDIUM), 2)
+        self.assertEqual(list(self.manager.code_to_locker), [codes[1]])
+
+    def test_21_assign_many_sets_expiry(self):
+        now = [0.0]
+        self.manager = LockerManager(ttl=5, clock=lambda: now[0])
+        self.add_lockers(LockerSize.SMALL, 2)
+        self.manager.assign_many([Package("P1", LockerSize.SMALL), Package("P2", LockerSize.SMALL)])
+        self.assertEqual(len(self.manager.expire_packages(now=5)), 2)
+        self.assertEqual(self.manager.free_count(LockerSize.SMALL), 2)
+
+    def test_22_concurrent_no_double_assignment(self):
+        self.manager = ConcurrentLockerManager(SmallestFitStrategy())
+        for size in LockerSize:
+            self.add_lockers(size, 40)
+        errors = []
+        holders = {}  # locker -> package, checked on every assignment
+        holders_lock = threading.Lock()
+
+        def worker(worker_id):
+            sizes = list(LockerSize)
+            for i in range(300):
+                package = Package(f"W{worker_id}-{i}", sizes[(worker_id + i) % 3])
+                try:
+                    code = self.manager.assign_package_to_locker(package)
+                except Exception:
+                    continue
+                locker = self.manager.code_to_locker[code]
+                with holders_lock:
+                    if locker in holders:
+                        errors.append(f"{locker.locker_id} double assigned")
+                    holders[locker] = package
+                time.sleep(0)  # let other workers run while the package is held
+                if locker.package is not package:
+                    errors.append(f"{locker.locker_id} lost its package while held")
+                # release the holder only once the package is out, under the lock so a worker that
+                # gets the freed locker next cannot see a stale holder
+                with holders_lock:
+                    if self.manager.retrieve_package(code) is not package:
+                        errors.append(f"wrong package for {code}")
+                    del holders[locker]
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.manager.code_to_locker, {})
+        for size in LockerSize:
+            self.assertEqual(self.manager.free_count(size), 40)
+
+    def test_23_concurrent_saturation_assigns_each_locker_once(self):
+        self.manager = ConcurrentLockerManager()
+        self.add_lockers(LockerSize.SMALL, 200)
+        codes = []
+        codes_lock = threading.Lock()
+
+        def worker(worker_id):
+            for i in range(50):
+                try:
+                    code = self.manager.assign_package_to_locker(Package(f"W{worker_id}-{i}", LockerSize.SMALL))
+                except Exception:
+                    continue
+                with codes_lock:
+                    codes.append(code)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(codes), 200)
+        self.assertEqual(len({id(self.manager.code_to_locker[code]) for code in codes}), 200)
+        self.assertEqual(self.manager.free_count(LockerSize.SMALL), 0)
+
+    def build_federation(self, positions, lockers_per_site=1, size=LockerSize.SMALL, cell_size=10.0):
+        federation = LockerFederation(cell_size)
+        for site_id, (x, y) in positions.items():
+            federation.add_site(LockerSite(site_id, x, y))
+            for i in range(lockers_per_site):
+                federation.add_locker(site_id, Locker(f"{site_id}-L{i}", size))
+        return federation
+
+    def test_24_federation_routes_to_nearest_site(self):
+        federation = self.build_federation({"SEA": (0, 0), "PDX": (25, -3), "SFO": (80, 60)})
+        code = federation.assign_package_to_locker(Package("P1", LockerSize.SMALL), 20, 0)
+        self.assertTrue(code.startswith("PDX-"))
+        # PDX is full now, the next package near it goes to SEA
+        code2 = federation.assign_package_to_locker(Package("P2", LockerSize.SMALL), 20, 0)
+        self.assertTrue(code2.startswith("SEA-"))
+        code3 = federation.assign_package_to_locker(Package("P3", LockerSize.SMALL), 20, 0)
+        self.assertTrue(code3.startswith("SFO-"))
+        with self.assertRaises(Exception):
+            federation.assign_package_to_locker(Package("P4", LockerSize.SMALL), 20, 0)
+
+    def test_25_federation_retrieve_goes_to_encoded_site(self):
+        federation = self.build_federation({"NYC-1": (0, 0), "NYC-2": (1, 1)})
+        package = Package("P1", LockerSize.SMALL)
+        code = federation.assign_package_to_locker(package, 1, 1)
+        self.assertTrue(code.startswith("NYC-2-"))
+        self.assertIs(federation.retrieve_package(code), package)
+        # the site is routable again once its locker is free
+        self.assertIs(federation.find_nearest_site(1, 1, LockerSize.SMALL), federation.sites["NYC-2"])
+        with self.assertRaises(Exception):
+            federation.retrieve_package(code)
+        with self.assertRaises(Exception):
+            federation.retrieve_package("NOPE-ABCDEF")
+
+    def test_26_federation_skips_sites_without_the_size(self):
+        federation = self.build_federation({"A": (0, 0)}, size=LockerSize.SMALL)
+        federation.add_site(LockerSite("B", 500, 500))
+        federation.add_locker("B", Locker("B-L0", LockerSize.LARGE))
+        self.assertIs(federation.find_nearest_site(0, 0, LockerSize.LARGE), federation.sites["B"])
+        self.assertIsNone(federation.find_nearest_site(0, 0, LockerSize.MEDIUM))
+
+    def test_27_federation_matches_brute_force(self):
+        rng = random.Random(7)
+        positions = {f"S{i}": (rng.uniform(-100, 100), rng.uniform(-100, 100)) for i in range(300)}
+        federation = self.build_federation(positions, cell_size=7.0)
+        for _ in range(200):
+            x, y = rng.uniform(-120, 120), rng.uniform(-120, 120)
+            site = federation.find_nearest_site(x, y, LockerSize.SMALL)
+            free = [s for s in federation.sites.values() if s.manager.free_count(LockerSize.SMALL)]
+            nearest = min(free, key=lambda s: ((s.x - x) ** 2 + (s.y - y) ** 2))
+            self.assertAlmostEqual((site.x - x) ** 2 + (site.y - y) ** 2, (nearest.x - x) ** 2 + (nearest.y - y) ** 2)
+            federation.assign_package_to_locker(Package("P", LockerSize.SMALL), x, y)
+
+    def persistent_manager(self, directory, **kwargs):
+        manager = PersistentLockerManager(directory, **kwargs)
+        self.addCleanup(lambda: manager.wal.closed or manager.close())
+        return manager
+
+    def test_28_wal_recovers_assignments(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = self.persistent_manager(directory, group_commit=4)
+            for i in range(5):
+                manager.add_locker(Locker(f"L{i}", LockerSize.SMALL))
+            codes = [manager.assign_package_to_locker(Package(f"P{i}", LockerSize.SMALL)) for i in range(3)]
+            manager.retrieve_package(codes[1])
+            manager.close()
+
+            recovered = self.persistent_manager(directory)
+            self.assertEqual(set(recovered.code_to_locker), {codes[0], codes[2]})
+            self.assertEqual(recovered.retrieve_package(codes[2]).package_id, "P2")
+            self.assertEqual(recovered.free_count(LockerSize.SMALL), 4)
+
+    def test_29_snapshot_plus_log_tail(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = self.persistent_manager(directory, ttl=30, clock=lambda: 100.0)
+            for i in range(3):
+                manager.add_locker(Locker(f"L{i}", LockerSize.MEDIUM))
+            first = manager.assign_package_to_locker(Package("P1", LockerSize.MEDIUM))
+            manager.snapshot()
+            second = manager.assign_package_to_locker(Package("P2", LockerSize.MEDIUM))
+            manager.retrieve_package(first)
+            manager.close()
+
+            recovered = self.persistent_manager(directory, clock=lambda: 100.0)
+            self.assertEqual(list(recovered.code_to_locker), [second])
+            self.assertEqual(recovered.code_to_locker[second].expires_at, 130.0)
+            self.assertEqual([p.package_id for p in recovered.expire_packages(now=130.0)], ["P2"])
+
+    def test_30_torn_log_tail_is_dropped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = self.persistent_manager(directory)
+            manager.add_locker(Locker("L0", LockerSize.SMALL))
+            code = manager.assign_package_to_locker(Package("P1", LockerSize.SMALL))
+            manager.close()
+            with open(os.path.join(directory, "lockers.wal"), "ab") as f:
+                f.write(b"\x40\x00\x00\x00\x02")  # half-written record
+            recovered = self.persistent_manager(directory)
+            self.assertEqual(list(recovered.code_to_locker), [code])
+            recovered.retrieve_package(code)
+            recovered.close()
+            self.assertEqual(self.persistent_manager(directory).free_count(LockerSize.SMALL), 1)
+
+    def test_31_stale_log_after_snapshot_is_ignored(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = self.persistent_manager(directory)
+            manager.add_locker(Locker("L0", LockerSize.SMALL))
+            manager.flush()
+            with open(os.path.join(directory, "lockers.wal"), "rb") as f:
+                old_log = f.read()
+            code = manager.assign_package_to_locker(Package("P1", LockerSize.SMALL))
+            manager.snapshot()
+            manager.close()
+            # simulate a crash between writing the snapshot and truncating the log
+            with open(os.path.join(directory, "lockers.wal"), "wb") as f:
+                f.write(old_log)
+            recovered = self.persistent_manager(directory)
+            self.assertEqual(list(recovered.locker_by_id), ["L0"])
+            self.assertEqual(list(recovered.code_to_locker), [code])
+
+    def test_32_federation_accepts_non_string_site_ids(self):
+        federation = self.build_federation({7: (0, 0), 8: (50, 50)})
+        package = Package("P1", LockerSize.SMALL)
+        code = federation.assign_package_to_locker(package, 1, 1)
+        self.assertTrue(code.startswith("7-"))
+        self.assertIs(federation.retrieve_package(code), package)
+        with self.assertRaises(ValueError):
+            federation.add_site(LockerSite("7", 5, 5))  # would encode to the same code prefix
+
+    def test_33_federation_expiry_visits_only_due_sites(self):
+        now = [1000.0]
+        federation = LockerFederation(10.0)
+        for site_id, x in (("A", 0), ("B", 100), ("C", 200)):
+            federation.add_site(LockerSite(site_id, x, 0, LockerManager(clock=lambda: now[0])))
+            federation.add_locker(site_id, Locker(f"{site_id}-L0", LockerSize.SMALL))
+        federation.assign_package_to_locker(Package("PA", LockerSize.SMALL), 0, 0, ttl=10)
+        federation.assign_package_to_locker(Package("PB", LockerSize.SMALL), 100, 0, ttl=50)
+        code_c = federation.assign_package_to_locker(Package("PC", LockerSize.SMALL), 200, 0, ttl=5)
+        federation.retrieve_package(code_c)  # leaves a stale deadline behind for C
+        swept = []
+
+        def count_sweeps(site):
+            expire = site.manager.expire_packages
+
+            def sweep(now=None):
+                swept.append(site.site_id)
+                return expire(now)
+
+            site.manager.expire_packages = sweep
+
+        for site in federation.sites.values():
+            count_sweeps(site)
+        now[0] = 1020
+        self.assertEqual([p.package_id for p in federation.expire_packages()], ["PA"])
+        self.assertEqual(sorted(swept), ["A", "C"])
+        swept.clear()
+        self.assertEqual(federation.expire_packages(), [])
+        self.assertEqual(swept, [])
+        self.assertEqual([p.package_id for p in federation.expire_packages(now=1060)], ["PB"])
+        self.assertEqual(swept, ["B"])
+
+    def test_34_wal_coerces_non_string_ids(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = self.persistent_manager(directory, group_commit=2)
+            manager.add_locker(Locker(1, LockerSize.SMALL))
+            manager.add_locker(Locker(2, LockerSize.SMALL))
+            code = manager.assign_package_to_locker(Package(7, LockerSize.SMALL))
+            manager.close()
+
+            recovered = self.persistent_manager(directory)
+            self.assertEqual(sorted(recovered.locker_by_id), ["1", "2"])
+            self.assertEqual(recovered.retrieve_package(code).package_id, "7")
+
+    def test_35_add_locker_rejects_recovered_ids(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = self.persistent_manager(directory)
+            manager.add_locker(Locker("L0", LockerSize.SMALL))
+            manager.close()
+
+            recovered = self.persistent_manager(directory)
+            with self.assertRaises(ValueError):
+                recovered.add_locker(Locker("L0", LockerSize.SMALL))
+            recovered.add_locker(Locker("L1", LockerSize.SMALL))
+            self.assertEqual(len(recovered.lockers[LockerSize.SMALL]), 2)
+            self.assertEqual(recovered.free_count(LockerSize.SMALL), 2)
+
+    def test_36_best_fit_keeps_a_scarce_large_pool_for_large_packages(self):
+        self.manager = LockerManager(BestFitStrategy())
+        self.add_lockers(LockerSize.SMALL, 100)
+        large = self.add_lockers(LockerSize.LARGE, 1)[0]
+        for i in range(99):
+            code = self.manager.assign_package_to_locker(Package(f"S{i}", LockerSize.SMALL))
+            self.assertEqual(self.manager.code_to_locker[code].size, LockerSize.SMALL)
+        code = self.manager.assign_package_to_locker(Package("L1", LockerSize.LARGE))
+        self.assertIs(self.manager.code_to_locker[code], large)
+        # with every pool past the threshold it is smallest fit, the last SMALL locker still gets used
+        self.manager.assign_package_to_locker(Package("S99", LockerSize.SMALL))
+        self.assertEqual(self.manager.free_count(LockerSize.SMALL), 0)
+
+    def test_37_federation_miss_and_far_queries_stay_cheap(self):
+        rng = random.Random(3)
+        positions = {f"S{i}": (rng.uniform(0, 1000), rng.uniform(0, 1000)) for i in range(300)}
+        federation = self.build_federation(positions, cell_size=1.0)
+        walked = []
+        ring_cells = federation.ring_cells
+
+        def counting_ring_cells(cx, cy, ring):
+            for cell in ring_cells(cx, cy, ring):
+                walked.append(cell)
+                yield cell
+
+        federation.ring_cells = counting_ring_cells
+        # no LARGE locker anywhere: answered from the free counts without walking the grid
+        self.assertIsNone(federation.find_nearest_site(500, 500, LockerSize.LARGE))
+        self.assertEqual(walked, [])
+        # far from every site: the walk gives up after about as many cells as there are occupied ones
+        site = federation.find_nearest_site(1e6, 1e6, LockerSize.SMALL)
+        nearest = min(federation.sites.values(), key=lambda s: (s.x - 1e6) ** 2 + (s.y - 1e6) ** 2)
+        self.assertIs(site, nearest)
+        self.assertLessEqual(len(walked), 300)
+
+    def test_38_wal_keeps_the_last_state_of_lockers_changed_within_a_group(self):
+        now = [100.0]
+        with tempfile.TemporaryDirectory() as directory:
+            manager = self.persistent_manager(directory, clock=lambda: now[0], group_commit=1000)
+            for i in range(4):
+                manager.add_locker(Locker(f"L{i}", LockerSize.SMALL))
+            manager.flush()
+            # every change below lands in one group, several of them on the same locker
+            first = manager.assign_package_to_locker(Package("P1", LockerSize.SMALL))
+            manager.retrieve_package(first)
+            kept = manager.assign_package_to_locker(Package("P2", LockerSize.SMALL))
+            manager.assign_package_to_locker(Package("P3", LockerSize.SMALL), ttl=5)
+            taken = manager.assign_package_to_locker(Package("P4", LockerSize.SMALL))
+            self.assertIsNone(manager.retrieve_many([taken, "missing"])[1])
+            now[0] = 110.0
+            self.assertEqual([p.package_id for p in manager.expire_packages()], ["P3"])
+            manager.close()
+
+            recovered = self.persistent_manager(directory, clock=lambda: now[0])
+            self.assertEqual(list(recovered.code_to_locker), [kept])
+            self.assertEqual(recovered.retrieve_package(kept).package_id, "P2")
+            self.assertEqual(recovered.free_count(LockerSize.SMALL), 4)
+
+    def test_39_wal_handles_ids_containing_nul(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = self.persistent_manager(directory)
+            manager.add_locker(Locker("L\x000", LockerSize.SMALL))
+            manager.add_locker(Locker("L1", LockerSize.SMALL))
+            code = manager.assign_package_to_locker(Package("P\x00\x00", LockerSize.SMALL))
+            manager.close()
+
+            recovered = self.persistent_manager(directory)
+            self.assertEqual(list(recovered.locker_by_id), ["L\x000", "L1"])
+            self.assertEqual(recovered.retrieve_package(code).package_id, "P\x00\x00")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+# Benchmarks for Design Amazon
+# Run: python bench_design_amazon.py
+
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+from designamazonclass import (Catalog, EventLog, FakePaymentGateway, Inventory, Order, OrderIdAllocator, OrderProjection,
+                               OrderStore, Payment, PaymentPipeline, Product, ProductAdded, User)
+
+def run_threads(n_threads, target):
+    threads = [threading.Thread(target=target, args=(n,)) for n in range(n_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+# Baseline: every reservation serialized behind one lock
+class GlobalLockInventory(Inventory):
+    def __init__(self):
+        super().__init__()
+        self.globallock = threading.Lock()
+
+    def reserve_many(self, items):
+        with self.globallock:
+            return super().reserve_many(items)
+
+def bench_hot_sku_reservations(n_threads=32, ops_per_thread=5_000):
+    print(f"== Reservations: {n_threads} threads on 10 hot SKUs ==")
+    for label, inventory in (("global lock", GlobalLockInventory()), ("per-product locks", Inventory())):
+        hot = [Product(f"H{i}", f"Hot {i}", 10, 10**9) for i in range(10)]
+
+        def shopper(seed):
+            for i in range(ops_per_thread):
+                reservation = inventory.reserve_many({hot[(seed + i) % 10]: 1, hot[(seed + i + 5) % 10]: 1})
+                inventory.release(reservation)
+
+        elapsed = run_threads(n_threads, shopper)
+        oversold = any(product.stock != 10**9 for product in hot)
+        print(f"{label:>17}: {n_threads * ops_per_thread / elapsed:,.0f} reserve+release/sec, stock consistent: {not oversold}")
+
+def bench_order_history(n_orders=100_000, n_queries=10_000):
+    print(f"== Order history for one user with {n_orders:,} orders ==")
+    store = OrderStore()
+    for i in range(n_orders):
+        store.addorder(Order({}, i, "U1", createdat=float(i)))
+    start = time.perf_counter()
+    for i in range(n_queries):
+        store.ordersforuser("U1", limit=20, cursor=(float(n_orders - 20 * i), n_orders - 20 * i))
+    elapsed = time.perf_counter() - start
+    print(f"20-order page: {elapsed / n_queries * 1e6:.1f} us/query")
+    start = time.perf_counter()
+    for i in range(n_queries):
+        store.ordersbystatus("Placed", since=float(n_orders - 3_600), limit=20)
+    elapsed = time.perf_counter() - start
+    print(f"Placed orders in the last hour, first page: {elapsed / n_queries * 1e6:.1f} us/query")
+
+def bench_order_ids(n_ids=1_000_000):
+    print("== Order id allocation ==")
+    for n_threads in (1, 8):
+        allocator = OrderIdAllocator()
+        per_thread = n_ids // n_threads
+
+        def worker(_):
+            nextid = allocator.nextid
+            for _ in range(per_thread):
+                nextid()
+
+        elapsed = run_threads(n_threads, worker)
+        print(f"{n_threads} thread(s): {n_ids / elapsed:,.0f} ids/sec")
+
+def bench_payments(n_payments=500, latency=0.02, failurerate=0.1):
+    print(f"== {n_payments} payments, {latency * 1000:.0f} ms gateway latency, {failurerate:.0%} failures ==")
+    payments = [Payment(Order({}, orderid), 10, "Credit Card") for orderid in range(n_payments)]
+
+    async def sequential(gateway):
+        for payment in payments:
+            await PaymentPipeline(gateway, concurrency=1).process(payment)
+
+    for label, run in (("sequential", lambda gateway: sequential(gateway)),
+                       ("pipeline x100", lambda gateway: PaymentPipeline(gateway, concurrency=100).processmany(payments))):
+        gateway = FakePaymentGateway(latency, failurerate, seed=1)
+        start = time.perf_counter()
+        asyncio.run(run(gateway))
+        elapsed = time.perf_counter() - start
+        completed = sum(payment.status == 'Completed' for payment in payments)
+        print(f"{label:>13}: {n_payments / elapsed:,.0f} payments/sec, {completed} completed")
+
+def bench_catalog(n_products=1_000_000, n_queries=10_000):
+    print(f"== Catalog queries at {n_products:,} products ==")
+    rng = random.Random(1)
+    words = [f"{a}{b}" for a in ("lap", "mou", "key", "mon", "cab", "hub", "cam", "mic") for b in ("top", "se", "board", "itor", "le", "ster")]
+    products = [Product(f"P{i:07d}", " ".join(rng.sample(words, 3)), rng.randint(1, 5_000), 10) for i in range(n_products)]
+    catalog = Catalog()
+    start = time.perf_counter()
+    catalog.addproducts(products)
+    print(f"bulk load: {time.perf_counter() - start:.2f}s")
+    queries = (
+        ("getproduct", lambda i: catalog.getproduct(f"P{i * 97 % n_products:07d}")),
+        ("prefixsearch", lambda i: catalog.prefixsearch(words[i % len(words)][:4])),
+        ("search, 2 words", lambda i: catalog.search(f"{words[i % len(words)]} {words[(i * 7 + 1) % len(words)]}")),
+        ("pricerange", lambda i: catalog.pricerange(i % 5_000, i % 5_000 + 50)),
+        ("reprice", lambda i: setattr(products[i * 97 % n_products], "price", i % 5_000 + 1)),
+    )
+    for label, query in queries:
+        n = n_queries if label != "search, 2 words" else n_queries // 100
+        start = time.perf_counter()
+        for i in range(n):
+            query(i)
+        print(f"{label:>15}: {(time.perf_counter() - start) / n * 1e6:,.1f} us/query")
+
+def bench_event_log(n_events=500_000):
+    print(f"== Event log, {n_events:,} events ==")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "events.log")
+        log = EventLog(path, batchsize=1_000)
+        start = time.perf_counter()
+        for i in range(n_events):
+            log.append(ProductAdded(f"U{i % 1_000}", f"P{i % 5_000}", 1, 25))
+        log.close()
+        print(f"append (raw events): {n_events / (time.perf_counter() - start):,.0f} events/sec")
+
+        products = [Product(f"P{i}", f"Product {i}", 25, 10**9) for i in range(100)]
+        log = EventLog(os.path.join(directory, "session.log"))
+        users = [User(f"U{i}", "Shopper", "shopper@example.com", eventlog=log) for i in range(100)]
+        start = time.perf_counter()
+        for i in range(n_events // 10):
+            user = users[i % 100]
+            user.cart.addproduct(products[i % 100], 1)
+            if i % 10 == 9:
+                user.placeorder()
+        log.close()
+        print(f"cart + checkout with logging: {n_events // 10 / (time.perf_counter() - start):,.0f} addproduct/sec")
+
+        projection = OrderProjection(os.path.join(directory, "orders.snapshot"))
+        start = time.perf_counter()
+        projection.tail(path)
+        print(f"replay: {n_events / (time.perf_counter() - start):,.0f} events/sec")
+        projection.snapshot()
+        start = time.perf_counter()
+        OrderProjection.restore(projection.snapshotpath).tail(path)
+        print(f"restore from snapshot + empty tail: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    bench_hot_sku_reservations()
+    bench_order_history()
+    bench_order_ids()
+    bench_payments()
+    bench_catalog()
+    bench_event_log()
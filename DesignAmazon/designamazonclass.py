@@ -11,13 +11,29 @@
 # every order can have 1 payment.
 # Concepts: Entity Modeling, Single-Responsibility / SOLID, State-Lifecycle Management
 
+import asyncio
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, namedtuple
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import weakref
+
 class User:
-    def __init__(self, userID, name, email):
+    def __init__(self, userID, name, email, store=None, eventlog=None):
         self.cart = Cart(self)  # we will create a cart class later
         self.userID = userID
         self.name = name
         self.email = email
         self.orders = []
+        self.store = store  # optional OrderStore for indexed order history
+        self.eventlog = eventlog  # optional EventLog that records cart and order events
 
     def addtocart(self, cart, product, quantity):
         self.cart.addproduct(product, quantity)  # we will create an add product function in a product class
@@ -26,32 +42,80 @@ class User:
         self.cart.removeproduct(product, quantity)  # we will create a remove product function
 
     def placeorder(self):
-        order = Order(self.cart.products, Order.ordercount)  # we will create an order later
+        order = Order(self.cart.products, Order.idallocator.nextid(), self.userID)  # we will create an order later
         self.orders.append(order)
+        if self.eventlog:
+            order.eventlog = self.eventlog
+            self.eventlog.append(OrderPlaced(self.userID, order.orderid, order.products, order.createdat))
+        if self.store:
+            self.store.addorder(order)
         self.cart.emptycart()  # we will create empty cart function in cart
         return order
 
     def vieworder(self):
         return self.orders
 
+    # newest first, returns (orders, cursor); pass the cursor back for the next page, None after the last
+    def vieworderpage(self, limit=20, cursor=None):
+        if self.store:
+            return self.store.ordersforuser(self.userID, limit, cursor)
+        end = len(self.orders) if cursor is None else cursor  # an index into orders, stable as new ones append
+        start = max(0, end - limit)
+        return self.orders[start:end][::-1], (start if start > 0 else None)
+
 class Product:
     def __init__(self, productID, name, price, stock):
         self.productID = productID
         self.name = name
-        self.price = price
+        self._price = price
         self.stock = stock
+        self.carts = weakref.WeakSet()  # carts holding this product, an abandoned cart drops out by itself
+        self.lock = threading.Lock()  # guards stock, one per product so hot items don't block each other
+        self.catalog = None  # set by Catalog so repricing keeps its price index current
+
+    # check-and-decrement under the product lock, so concurrent shoppers can't oversell
+    def takestock(self, quantity):
+        with self.lock:
+            if quantity > self.stock:
+                return False
+            self.stock -= quantity
+            return True
+
+    def returnstock(self, quantity):
+        with self.lock:
+            self.stock += quantity
+
+    @property
+    def price(self):
+        return self._price
+
+    @price.setter
+    def price(self, newprice):
+        oldprice, self._price = self._price, newprice
+        for cart in list(self.carts):
+            if not cart.reprice(self, oldprice, newprice):
+                self.carts.discard(cart)
+        if self.catalog:
+            self.catalog.repriced(self, oldprice)
 
 class Cart:
     def __init__(self, user):
         self.user = user
         self.products = {}
+        # running totals so viewing or checking out a cart never walks every line
+        self.linetotals = {}
+        self.subtotal = 0
+        self.itemcount = 0
 
     def addproduct(self, product, quantity):
-        if quantity > product.stock:
+        if not product.takestock(quantity):
             print(f'There are only {product.stock} left.')
         else:
             self.products[product] = quantity + self.products.get(product, 0)
-            product.stock -= quantity
+            self.updateline(product, quantity)
+            product.carts.add(self)
+            if self.user.eventlog:
+                self.user.eventlog.append(ProductAdded(self.user.userID, product.productID, quantity, product.price))
 
     def removeproduct(self, product, quantity):
         if product not in self.products or quantity > self.products[product]:
@@ -59,24 +123,283 @@ class Cart:
             print(f'There are only {cart_quantity} of this product in your cart.')
         else:
             self.products[product] -= quantity
+            self.updateline(product, -quantity)
             if self.products[product] == 0:
                 del self.products[product]
-            product.stock += quantity
+                del self.linetotals[product]
+                product.carts.discard(self)
+                if not self.products:
+                    self.subtotal = 0  # drop the float drift the running total picked up
+            product.returnstock(quantity)
+            if self.user.eventlog:
+                self.user.eventlog.append(ProductRemoved(self.user.userID, product.productID, quantity))
+
+    # O(1) bookkeeping for a quantity change of one line
+    def updateline(self, product, quantity):
+        self.linetotals[product] = self.products[product] * product.price
+        self.subtotal += quantity * product.price
+        self.itemcount += quantity
+
+    # called by Product when its price changes, returns False once the product left this cart
+    def reprice(self, product, oldprice, newprice):
+        if product not in self.products:
+            return False
+        self.linetotals[product] = self.products[product] * newprice
+        self.subtotal += self.products[product] * (newprice - oldprice)
+        return True
 
     def viewcart(self):
         return self.products
 
     def emptycart(self):
+        for product in self.products:
+            product.carts.discard(self)
         self.products.clear()
+        self.linetotals.clear()
+        self.subtotal = 0
+        self.itemcount = 0
+        if self.user.eventlog:
+            self.user.eventlog.append(CartEmptied(self.user.userID))
+
+# Snowflake-style order ids: milliseconds since EPOCH_MS, then node (one per host), process id, thread slot
+# and a per-thread sequence. Every thread allocates from its own slot, so no lock is shared between threads,
+# and ids are unique across hosts/processes/threads and sort by creation time. A thread that uses up its
+# sequence within one millisecond (or sees the clock go backwards) borrows the next millisecond.
+# The pid makes every live process on a host distinct with no coordination, forked workers included, and
+# a pid is only reused after its process is gone. Ids are wider than 64 bits.
+class OrderIdAllocator:
+    EPOCH_MS = 1735689600000  # 2025-01-01 UTC
+    NODE_BITS = 7  # hosts
+    PROCESS_BITS = 32  # pids, wide enough for every platform
+    SLOT_BITS = 6  # threads per process with a slot of their own, the last slot is shared by any others
+    SEQUENCE_BITS = 9  # ids per thread per millisecond
+
+    def __init__(self, nodeid=0, clock=time.time):
+        if not 0 <= nodeid < 1 << self.NODE_BITS:
+            raise ValueError(f"nodeid must be below {1 << self.NODE_BITS}")
+        self.nodeid = nodeid
+        self.processid = os.getpid()
+        self.clock = clock
+        slots = 1 << self.SLOT_BITS
+        self.sharedslot = slots - 1
+        self.sharedlock = threading.Lock()
+        self.freeslots = list(range(self.sharedslot))  # list append/pop are atomic under the GIL
+        self.lastms = [-1] * slots  # per slot, only touched by the thread holding it (or under sharedlock)
+        self.sequence = [0] * slots
+        self.local = threading.local()
+
+    # os.fork hook (registered for Order.idallocator): the child allocates under its own pid
+    def afterfork(self):
+        self.processid = os.getpid()
+        self.sharedlock = threading.Lock()
+        # only the forking thread exists in the child; every other thread's slot is free again
+        lease = getattr(self.local, 'lease', None)
+        self.freeslots = [slot for slot in range(self.sharedslot) if lease is None or slot != lease.slot]
+
+    def nextid(self):
+        lease = getattr(self.local, 'lease', None)
+        if lease is None:
+            lease = self.local.lease = self.claimslot()
+        if lease.slot == self.sharedslot:
+            with self.sharedlock:
+                return self.allocate(lease.slot)
+        return self.allocate(lease.slot)
+
+    def allocate(self, slot):
+        ms = int(self.clock() * 1000) - self.EPOCH_MS
+        lastms = self.lastms[slot]
+        if ms > lastms:
+            sequence = 0
+        else:
+            ms, sequence = lastms, self.sequence[slot] + 1
+            if sequence >> self.SEQUENCE_BITS:
+                ms, sequence = lastms + 1, 0
+        self.lastms[slot] = ms
+        self.sequence[slot] = sequence
+        node = (ms << self.NODE_BITS | self.nodeid) << self.PROCESS_BITS | self.processid
+        return ((node << self.SLOT_BITS | slot) << self.SEQUENCE_BITS) | sequence
+
+    # a thread beyond the private slots shares the last one under a lock rather than failing
+    def claimslot(self):
+        try:
+            lease = OrderIdLease(self.freeslots.pop())
+        except IndexError:
+            return OrderIdLease(self.sharedslot)
+        # the lease dies with the thread's locals; its slot (and the slot's last ms) go to the next thread
+        weakref.finalize(lease, self.freeslots.append, lease.slot)
+        return lease
+
+class OrderIdLease:
+    def __init__(self, slot):
+        self.slot = slot
+
+# Product catalog: id lookup, name prefix search, keyword search and price ranges.
+# The name and price indexes are sorted lists of (key, productID), so queries are a bisect plus a walk;
+# single adds and reprices update them in place, addproducts bulk-loads with one sort.
+class Catalog:
+    TOKEN = re.compile(r'[a-z0-9]+')
+
+    def __init__(self):
+        self.products = {}  # productID -> Product
+        self.names = []  # (lowercased name, productID)
+        self.prices = []  # (price, productID)
+        self.tokens = defaultdict(set)  # name token -> productIDs
+
+    def addproduct(self, product):
+        self.index(product)
+        insort(self.names, (product.name.lower(), product.productID))
+        insort(self.prices, (product.price, product.productID))
+
+    # all or nothing: the whole batch is checked for duplicate ids before any index changes
+    def addproducts(self, products):
+        products = list(products)
+        seen = set()
+        for product in products:
+            if product.productID in self.products or product.productID in seen:
+                raise ValueError(f"Product {product.productID} is already in the catalog")
+            seen.add(product.productID)
+        for product in products:
+            self.index(product)
+            self.names.append((product.name.lower(), product.productID))
+            self.prices.append((product.price, product.productID))
+        self.names.sort()
+        self.prices.sort()
+
+    def index(self, product):
+        if product.productID in self.products:
+            raise ValueError(f"Product {product.productID} is already in the catalog")
+        self.products[product.productID] = product
+        for token in self.TOKEN.findall(product.name.lower()):
+            self.tokens[token].add(product.productID)
+        product.catalog = self
+
+    def repriced(self, product, oldprice):
+        del self.prices[bisect_left(self.prices, (oldprice, product.productID))]
+        insort(self.prices, (product.price, product.productID))
+
+    def getproduct(self, productID):
+        return self.products.get(productID)
+
+    # products whose name starts with prefix, in name order
+    def prefixsearch(self, prefix, limit=20):
+        prefix = prefix.lower()
+        results = []
+        for i in range(bisect_left(self.names, (prefix,)), len(self.names)):
+            name, productID = self.names[i]
+            if not name.startswith(prefix) or len(results) == limit:
+                break
+            results.append(self.products[productID])
+        return results
+
+    # products whose name contains every word of the query, in name order
+    def search(self, query, limit=20):
+        tokens = self.TOKEN.findall(query.lower())
+        if not tokens:
+            return []
+        postings = sorted((self.tokens.get(token, set()) for token in tokens), key=len)
+        matches = postings[0].intersection(*postings[1:])
+        return heapq.nsmallest(limit, (self.products[productID] for productID in matches),
+                               key=lambda product: (product.name.lower(), product.productID))
+
+    # low <= price <= high, cheapest first
+    def pricerange(self, low, high, limit=20):
+        start = bisect_left(self.prices, (low,))
+        end = min(bisect_left(self.prices, (math.nextafter(high, math.inf),)), start + limit)
+        return [self.products[productID] for _, productID in self.prices[start:end]]
+
+# Frozen at checkout: plain ids and prices, so orders don't pin Product objects or share the cart's dict
+OrderLine = namedtuple('OrderLine', ['productid', 'quantity', 'unitprice'])
 
 class Order:
-    ordercount = 0
+    idallocator = OrderIdAllocator()  # forked workers allocate under their own pid, see OrderIdAllocator
 
-    def __init__(self, products, orderid):
+    def __init__(self, products, orderid, userid=None, createdat=None):
         self.orderid = orderid
-        Order.ordercount += 1
-        self.products = products
-        self.status = 'Placed'
+        self.products = self.freezelines(products)
+        self.total = sum(line.quantity * line.unitprice for line in self.products)
+        self.userid = userid
+        self.createdat = time.time() if createdat is None else createdat
+        self.store = None  # set by OrderStore.addorder so status changes keep its index current
+        self.eventlog = None  # set by User.placeorder when the user records events
+        self._status = 'Placed'
+
+    # accepts a cart's {Product: quantity} dict or existing order lines
+    @staticmethod
+    def freezelines(products):
+        if isinstance(products, dict):
+            return tuple(OrderLine(product.productID, quantity, product.price) for product, quantity in products.items())
+        return tuple(OrderLine(*line) for line in products)
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, newstatus):
+        oldstatus, self._status = self._status, newstatus
+        if oldstatus == newstatus:
+            return
+        if self.store:
+            self.store.statuschanged(self, oldstatus)
+        if self.eventlog:
+            self.eventlog.append(OrderStatusChanged(self.orderid, newstatus))
+
+if hasattr(os, 'register_at_fork'):
+    # looked up at fork time, so a replaced Order.idallocator is the one that gets the hook
+    os.register_at_fork(after_in_child=lambda: Order.idallocator.afterfork())
+
+# Central order repository. Every index is a list of (createdat, orderid) keys kept sorted,
+# so a page is a bisect plus a slice: O(log n + page).
+class OrderStore:
+    def __init__(self):
+        self.orders = {}  # orderid -> Order
+        self.byuser = defaultdict(list)  # userid -> keys
+        self.bystatus = defaultdict(list)  # status -> keys
+        self.bytime = []  # every key
+
+    def addorder(self, order):
+        key = (order.createdat, order.orderid)
+        self.orders[order.orderid] = order
+        insort(self.byuser[order.userid], key)  # appends in O(log n) when orders arrive in time order
+        insort(self.bystatus[order.status], key)
+        insort(self.bytime, key)
+        order.store = self
+
+    def getorder(self, orderid):
+        return self.orders.get(orderid)
+
+    def statuschanged(self, order, oldstatus):
+        key = (order.createdat, order.orderid)
+        keys = self.bystatus[oldstatus]
+        del keys[bisect_left(keys, key)]
+        insort(self.bystatus[order.status], key)
+
+    def ordersforuser(self, userid, limit=20, cursor=None, since=None, until=None, newestfirst=True):
+        return self.page(self.byuser.get(userid, []), limit, cursor, since, until, newestfirst)
+
+    def ordersbystatus(self, status, limit=20, cursor=None, since=None, until=None, newestfirst=True):
+        return self.page(self.bystatus.get(status, []), limit, cursor, since, until, newestfirst)
+
+    def ordersbetween(self, since=None, until=None, limit=20, cursor=None, newestfirst=True):
+        return self.page(self.bytime, limit, cursor, since, until, newestfirst)
+
+    # returns (orders, cursor); since is inclusive, until exclusive, cursor is None after the last page
+    def page(self, keys, limit, cursor, since, until, newestfirst):
+        lo = bisect_left(keys, (since,)) if since is not None else 0
+        hi = bisect_left(keys, (until,)) if until is not None else len(keys)
+        if cursor is not None:
+            if newestfirst:
+                hi = min(hi, bisect_left(keys, cursor))
+            else:
+                lo = max(lo, bisect_right(keys, cursor))
+        if newestfirst:
+            pagekeys = keys[max(lo, hi - limit):hi][::-1]
+            more = hi - limit > lo
+        else:
+            pagekeys = keys[lo:min(hi, lo + limit)]
+            more = lo + limit < hi
+        orders = [self.orders[orderid] for _, orderid in pagekeys]
+        return orders, (pagekeys[-1] if more else None)
 
 class Payment:
     def __init__(self, order, amount, paymenttype):
@@ -87,6 +410,260 @@ class Payment:
 
     def processpayment(self):
         self.status = 'Completed'
+        self.recordstatus()
+
+    def recordstatus(self):
+        if self.order.eventlog:
+            self.order.eventlog.append(PaymentProcessed(self.order.orderid, self.amount, self.paymenttype, self.status))
+
+class PaymentGatewayError(Exception):
+    pass
+
+# Local stand-in for a payment network: every authorization takes `latency` seconds and fails with
+# probability `failurerate`. A repeated idempotency key returns the earlier success without charging again.
+class FakePaymentGateway:
+    def __init__(self, latency=0.2, failurerate=0.0, seed=None):
+        self.latency = latency
+        self.failurerate = failurerate
+        self.random = random.Random(seed)
+        self.charges = {}  # idempotency key -> amount charged
+        self.calls = 0
+
+    async def authorize(self, idempotencykey, amount):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if idempotencykey in self.charges:
+            return True
+        if self.random.random() < self.failurerate:
+            raise PaymentGatewayError("Authorization declined by gateway.")
+        self.charges[idempotencykey] = amount
+        return True
+
+# Keeps many payments in flight with at most `concurrency` gateway calls at once. Each attempt is capped
+# at `timeout` seconds and failures retry with exponential backoff. The order id is the idempotency key,
+# so retries and duplicate submissions for an order share one authorization.
+class PaymentPipeline:
+    TRANSIENT = (PaymentGatewayError, asyncio.TimeoutError, OSError)  # OSError covers resets and refused connections
+
+    def __init__(self, gateway, concurrency=100, timeout=1.0, retries=3, backoff=0.05):
+        self.gateway = gateway
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.authorizations = {}  # idempotency key -> Task, failed keys are dropped so they can be resubmitted
+
+    async def process(self, payment):
+        key = f"order-{payment.order.orderid}"
+        task = self.authorizations.get(key)
+        if task is None:
+            task = self.authorizations[key] = asyncio.ensure_future(self.authorize(key, payment.amount))
+        payment.status = 'Completed' if await task else 'Failed'
+        payment.recordstatus()
+        return payment.status
+
+    async def processmany(self, payments):
+        return await asyncio.gather(*(self.process(payment) for payment in payments))
+
+    # only a success stays cached; a decline, giving up, an unexpected error or cancellation drops the key
+    async def authorize(self, key, amount):
+        approved = False
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))  # back off without holding a slot
+                try:
+                    async with self.semaphore:
+                        approved = await asyncio.wait_for(self.gateway.authorize(key, amount), self.timeout)
+                    return approved
+                except self.TRANSIENT:
+                    pass
+            return False
+        finally:
+            if not approved:
+                self.authorizations.pop(key, None)
+
+# Time-limited stock holds, e.g. while a shopper is in checkout
+class Reservation:
+    def __init__(self, reservationid, items, expiresat):
+        self.reservationid = reservationid
+        self.items = items  # product -> quantity
+        self.expiresat = expiresat
+        self.status = 'Held'
+
+class Inventory:
+    def __init__(self, ttl=900, clock=time.monotonic):
+        self.ttl = ttl  # seconds a reservation holds stock before it expires back
+        self.clock = clock
+        self.held = {}  # reservationid -> Reservation still holding stock
+        self.expiryheap = []  # (expiresat, reservationid), entries for finished reservations are skipped
+        self.lock = threading.Lock()  # guards held and expiryheap, never taken together with a product lock
+        self.ids = itertools.count(1)
+
+    def reserve(self, product, quantity):
+        return self.reserve_many({product: quantity})
+
+    # all-or-nothing across the items; returns a Reservation or None when anything is short
+    def reserve_many(self, items):
+        products = sorted(items, key=lambda product: product.productID)  # fixed lock order, no deadlocks
+        for product in products:
+            product.lock.acquire()
+        try:
+            if any(items[product] > product.stock for product in products):
+                return None
+            for product in products:
+                product.stock -= items[product]
+        finally:
+            for product in products:
+                product.lock.release()
+        reservation = Reservation(next(self.ids), dict(items), self.clock() + self.ttl)
+        with self.lock:
+            self.held[reservation.reservationid] = reservation
+            heapq.heappush(self.expiryheap, (reservation.expiresat, reservation.reservationid))
+        return reservation
+
+    # stock is sold, keep it; False if the reservation already expired or was released
+    def commit(self, reservation):
+        with self.lock:
+            if self.held.pop(reservation.reservationid, None) is None:
+                return False
+        reservation.status = 'Committed'
+        return True
+
+    def release(self, reservation):
+        return self.finish(reservation.reservationid, 'Released')
+
+    def finish(self, reservationid, status):
+        with self.lock:
+            reservation = self.held.pop(reservationid, None)
+        if reservation is None:
+            return False
+        for product, quantity in reservation.items.items():
+            product.returnstock(quantity)
+        reservation.status = status
+        return True
+
+    # only touches the reservations that are due; returns how many expired
+    def expirereservations(self, now=None):
+        now = self.clock() if now is None else now
+        due = []
+        with self.lock:
+            while self.expiryheap and self.expiryheap[0][0] <= now:
+                due.append(heapq.heappop(self.expiryheap)[1])
+        return sum(self.finish(reservationid, 'Expired') for reservationid in due)
+
+# Event sourcing: cart and order changes as typed events in an append-only JSON-lines log
+ProductAdded = namedtuple('ProductAdded', ['userid', 'productid', 'quantity', 'unitprice'])
+ProductRemoved = namedtuple('ProductRemoved', ['userid', 'productid', 'quantity'])
+CartEmptied = namedtuple('CartEmptied', ['userid'])
+OrderPlaced = namedtuple('OrderPlaced', ['userid', 'orderid', 'lines', 'createdat'])
+OrderStatusChanged = namedtuple('OrderStatusChanged', ['orderid', 'status'])
+PaymentProcessed = namedtuple('PaymentProcessed', ['orderid', 'amount', 'paymenttype', 'status'])
+EVENTTYPES = {eventtype.__name__: eventtype for eventtype in
+              (ProductAdded, ProductRemoved, CartEmptied, OrderPlaced, OrderStatusChanged, PaymentProcessed)}
+
+# Events are buffered and written in batches of `batchsize` (flush() forces it); fsync only when durable.
+class EventLog:
+    def __init__(self, path, batchsize=1000, durable=False):
+        self.path = path
+        self.batchsize = batchsize
+        self.durable = durable
+        self.pending = []
+        self.lock = threading.Lock()  # guards pending; appenders only ever wait on this
+        self.writelock = threading.Lock()  # one flush at a time, so batches reach the file in order
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def append(self, event):
+        with self.lock:
+            self.pending.append(event)
+            full = len(self.pending) >= self.batchsize
+        if full:
+            self.flush()
+
+    # swap the buffer out under the lock, then write it while appenders carry on
+    def flush(self):
+        with self.writelock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return
+            self.file.write(''.join([json.dumps([type(event).__name__, *event]) + '\n' for event in batch]))
+            self.file.flush()
+            if self.durable:
+                os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+# Read model rebuilt by replaying the log. Replicas call tail() to pick up new events from where they
+# stopped; a snapshot stores the state plus the log offset, so a restart only replays the tail.
+class OrderProjection:
+    def __init__(self, snapshotpath=None, snapshotevery=None):
+        self.carts = defaultdict(dict)  # userid -> {productid: quantity}
+        self.orders = {}  # orderid -> {'userid', 'lines', 'createdat', 'status', 'payment'}
+        self.offset = 0  # byte offset of the first log line not applied yet
+        self.applied = 0
+        self.snapshotpath = snapshotpath
+        self.snapshotevery = snapshotevery  # events between automatic snapshots
+
+    def apply(self, event):
+        if isinstance(event, ProductAdded):
+            cart = self.carts[event.userid]
+            cart[event.productid] = cart.get(event.productid, 0) + event.quantity
+        elif isinstance(event, ProductRemoved):
+            cart = self.carts[event.userid]
+            cart[event.productid] -= event.quantity
+            if not cart[event.productid]:
+                del cart[event.productid]
+        elif isinstance(event, OrderPlaced):
+            self.orders[event.orderid] = {'userid': event.userid, 'lines': [OrderLine(*line) for line in event.lines],
+                                          'createdat': event.createdat, 'status': 'Placed', 'payment': None}
+        elif isinstance(event, CartEmptied):
+            self.carts.pop(event.userid, None)
+        elif isinstance(event, OrderStatusChanged):
+            self.orders[event.orderid]['status'] = event.status
+        elif isinstance(event, PaymentProcessed):
+            self.orders[event.orderid]['payment'] = event.status
+
+    # apply every complete line past self.offset, returns how many events were applied
+    def tail(self, logpath):
+        with open(logpath, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1  # a half-written last line waits for the next tail
+        count = 0
+        for line in data[:end].splitlines(keepends=True):
+            name, *fields = json.loads(line)
+            self.apply(EVENTTYPES[name](*fields))
+            self.offset += len(line)
+            self.applied += 1
+            count += 1
+            if self.snapshotevery and self.applied % self.snapshotevery == 0:
+                self.snapshot()
+        return count
+
+    def snapshot(self, path=None):
+        path = path or self.snapshotpath
+        state = {'offset': self.offset, 'carts': [[userid, list(cart.items())] for userid, cart in self.carts.items()],
+                 'orders': [[orderid, order] for orderid, order in self.orders.items()]}
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def restore(cls, path, snapshotevery=None):
+        projection = cls(path, snapshotevery)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            projection.offset = state['offset']
+            for userid, items in state['carts']:
+                projection.carts[userid] = dict(items)
+            for orderid, order in state['orders']:
+                order['lines'] = [OrderLine(*line) for line in order['lines']]
+                projection.orders[orderid] = order
+        return projection
 
 # Example usage
 if __name__ == "__main__":
@@ -104,10 +681,11 @@ if __name__ == "__main__":
 
     # View cart
     print("Cart contents:", user1.cart.viewcart())
+    print(f"Cart subtotal: {user1.cart.subtotal} for {user1.cart.itemcount} items")
 
     # Place order
     order = user1.placeorder()
-    print(f"Order placed with ID: {order.orderid}")
+    print(f"Order placed with ID: {order.orderid}, lines: {order.products}, total: {order.total}")
 
     # Process payment
     payment = Payment(order, 1050, "Credit Card")
@@ -0,0 +1,553 @@
+import asyncio
+import gc
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+from designamazonclass import (Catalog, EventLog, FakePaymentGateway, Inventory, Order, OrderIdAllocator, OrderLine, OrderProjection,
+                               OrderStore, Payment, PaymentPipeline, Product, ProductAdded, User)
+
+
+def allocate_order_ids(_):
+    # the path User.placeorder takes: the shared class-level allocator, in a forked worker
+    results = [[] for _ in range(4)]
+
+    def worker(out):
+        for _ in range(2_000):
+            out.append(Order.idallocator.nextid())
+
+    threads = [threading.Thread(target=worker, args=(out,)) for out in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return Order.idallocator.processid, [i for chunk in results for i in chunk]
+
+
+def allocate_node_ids(nodeid):
+    # Order.idallocator as a worker on host `nodeid` would configure it
+    Order.idallocator.nodeid = nodeid
+    return [Order.idallocator.nextid() for _ in range(100)]
+
+
+def allocate_ids(nodeid, n_threads=4, per_thread=5_000):
+    allocator = OrderIdAllocator(nodeid)
+    results = [[] for _ in range(n_threads)]
+
+    def worker(out):
+        for _ in range(per_thread):
+            out.append(allocator.nextid())
+
+    threads = [threading.Thread(target=worker, args=(out,)) for out in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestDesignAmazon(unittest.TestCase):
+
+    def setUp(self):
+        self.laptop = Product("P001", "Laptop", 1000, 10)
+        self.mouse = Product("P002", "Mouse", 25, 100)
+        self.user = User("U001", "John Doe", "john@example.com")
+
+    def test_01_cart_running_totals(self):
+        self.user.addtocart(self.user.cart, self.laptop, 1)
+        self.user.addtocart(self.user.cart, self.mouse, 2)
+        self.user.addtocart(self.user.cart, self.mouse, 1)
+        cart = self.user.cart
+        self.assertEqual(cart.subtotal, 1075)
+        self.assertEqual(cart.itemcount, 4)
+        self.assertEqual(cart.linetotals, {self.laptop: 1000, self.mouse: 75})
+
+    def test_02_remove_updates_totals(self):
+        cart = self.user.cart
+        cart.addproduct(self.mouse, 3)
+        cart.addproduct(self.laptop, 1)
+        cart.removeproduct(self.mouse, 2)
+        self.assertEqual(cart.subtotal, 1025)
+        self.assertEqual(cart.itemcount, 2)
+        cart.removeproduct(self.mouse, 1)
+        self.assertNotIn(self.mouse, cart.linetotals)
+        self.assertEqual(cart.subtotal, 1000)
+
+    def test_03_failed_changes_leave_totals_alone(self):
+        cart = self.user.cart
+        cart.addproduct(self.laptop, 11)
+        cart.removeproduct(self.mouse, 1)
+        self.assertEqual((cart.subtotal, cart.itemcount), (0, 0))
+
+    def test_04_price_change_updates_carts(self):
+        other = User("U002", "Jane Doe", "jane@example.com")
+        self.user.cart.addproduct(self.laptop, 2)
+        other.cart.addproduct(self.laptop, 1)
+        self.laptop.price = 900
+        self.assertEqual(self.user.cart.subtotal, 1800)
+        self.assertEqual(self.user.cart.linetotals[self.laptop], 1800)
+        self.assertEqual(other.cart.subtotal, 900)
+
+    def test_05_price_change_after_removal_is_ignored(self):
+        cart = self.user.cart
+        cart.addproduct(self.laptop, 1)
+        cart.addproduct(self.mouse, 1)
+        cart.removeproduct(self.laptop, 1)
+        self.laptop.price = 1
+        self.assertEqual(cart.subtotal, 25)
+        self.assertNotIn(cart, self.laptop.carts)
+
+    def test_06_emptycart_resets_totals(self):
+        cart = self.user.cart
+        cart.addproduct(self.laptop, 1)
+        cart.emptycart()
+        self.assertEqual((cart.subtotal, cart.itemcount, cart.linetotals), (0, 0, {}))
+        self.laptop.price = 10
+        self.assertEqual(cart.subtotal, 0)
+
+    def test_07_reserve_many_is_all_or_nothing(self):
+        inventory = Inventory()
+        self.assertIsNone(inventory.reserve_many({self.laptop: 5, self.mouse: 101}))
+        self.assertEqual((self.laptop.stock, self.mouse.stock), (10, 100))
+        reservation = inventory.reserve_many({self.laptop: 5, self.mouse: 100})
+        self.assertEqual((self.laptop.stock, self.mouse.stock), (5, 0))
+        self.assertTrue(inventory.release(reservation))
+        self.assertFalse(inventory.release(reservation))
+        self.assertEqual((self.laptop.stock, self.mouse.stock), (10, 100))
+        self.assertEqual(reservation.status, 'Released')
+
+    def test_08_reservations_expire_back_into_stock(self):
+        now = [0.0]
+        inventory = Inventory(ttl=60, clock=lambda: now[0])
+        held = inventory.reserve(self.laptop, 4)
+        kept = inventory.reserve(self.laptop, 2)
+        self.assertTrue(inventory.commit(kept))
+        now[0] = 59
+        self.assertEqual(inventory.expirereservations(), 0)
+        now[0] = 60
+        self.assertEqual(inventory.expirereservations(), 1)
+        self.assertEqual(held.status, 'Expired')
+        self.assertEqual(self.laptop.stock, 8)
+        self.assertFalse(inventory.commit(held))
+
+    def test_09_concurrent_reservations_never_oversell(self):
+        inventory = Inventory()
+        hot = [Product(f"H{i}", f"Hot {i}", 10, 500) for i in range(10)]
+        reservations = []
+        record = threading.Lock()
+
+        def shopper(seed):
+            for i in range(200):
+                items = {hot[(seed + i) % 10]: 1, hot[(seed + 3 * i + 1) % 10]: 2}
+                reservation = inventory.reserve_many(items)
+                if reservation:
+                    with record:
+                        reservations.append(reservation)
+
+        threads = [threading.Thread(target=shopper, args=(n,)) for n in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        held = {product: 0 for product in hot}
+        for reservation in reservations:
+            for product, quantity in reservation.items.items():
+                held[product] += quantity
+        for product in hot:
+            self.assertGreaterEqual(product.stock, 0)
+            self.assertEqual(product.stock + held[product], 500)
+
+    def test_10_cart_uses_locked_stock(self):
+        self.user.cart.addproduct(self.laptop, 10)
+        self.user.cart.addproduct(self.laptop, 1)
+        self.assertEqual(self.laptop.stock, 0)
+        self.assertEqual(self.user.cart.products[self.laptop], 10)
+
+    def build_store(self):
+        store = OrderStore()
+        for i in range(50):
+            order = Order({}, 1000 + i, f"U{i % 2}", createdat=float(i))
+            store.addorder(order)
+        return store
+
+    def test_11_user_history_pages_newest_first(self):
+        store = self.build_store()
+        seen = []
+        orders, cursor = store.ordersforuser("U0", limit=10)
+        seen += orders
+        while cursor:
+            orders, cursor = store.ordersforuser("U0", limit=10, cursor=cursor)
+            seen += orders
+        self.assertEqual([order.orderid for order in seen], list(range(1048, 999, -2)))
+
+    def test_12_status_index_follows_status_changes(self):
+        store = self.build_store()
+        for orderid in (1010, 1020, 1030):
+            store.getorder(orderid).status = 'Shipped'
+        shipped, cursor = store.ordersbystatus('Shipped', limit=10)
+        self.assertEqual([order.orderid for order in shipped], [1030, 1020, 1010])
+        self.assertIsNone(cursor)
+        placed, _ = store.ordersbystatus('Placed', limit=100)
+        self.assertEqual(len(placed), 47)
+
+    def test_13_time_window_queries(self):
+        store = self.build_store()
+        orders, cursor = store.ordersbystatus('Placed', since=40, limit=5, newestfirst=False)
+        self.assertEqual([order.orderid for order in orders], [1040, 1041, 1042, 1043, 1044])
+        orders, cursor = store.ordersbystatus('Placed', since=40, limit=5, cursor=cursor, newestfirst=False)
+        self.assertEqual([order.orderid for order in orders], [1045, 1046, 1047, 1048, 1049])
+        self.assertIsNone(cursor)
+        orders, _ = store.ordersbetween(since=10, until=13)
+        self.assertEqual([order.orderid for order in orders], [1012, 1011, 1010])
+
+    def test_14_placeorder_feeds_store(self):
+        store = OrderStore()
+        user = User("U9", "Store User", "store@example.com", store)
+        for _ in range(3):
+            user.cart.addproduct(self.mouse, 1)
+            user.placeorder()
+        page, cursor = user.vieworderpage(limit=2)
+        self.assertEqual(page, user.orders[:0:-1])
+        self.assertEqual(user.vieworderpage(limit=2, cursor=cursor), (user.orders[:1], None))
+        self.assertEqual(user.vieworder(), user.orders)
+
+    def test_15_ids_increase_within_a_thread(self):
+        now = [1800000000.0]
+        allocator = OrderIdAllocator(3, clock=lambda: now[0])
+        ids = [allocator.nextid() for _ in range(2000)]  # more than one millisecond's sequence
+        now[0] -= 5  # clock steps backwards
+        ids += [allocator.nextid() for _ in range(10)]
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_16_ids_sort_by_time(self):
+        now = [1800000000.0]
+        allocator = OrderIdAllocator(clock=lambda: now[0])
+        first = allocator.nextid()
+        now[0] += 0.002
+        other_node = OrderIdAllocator(100, clock=lambda: now[0]).nextid()
+        self.assertLess(first, other_node)
+
+    def test_17_ids_unique_across_threads(self):
+        ids = [i for chunk in allocate_ids(0, n_threads=16, per_thread=2_000) for i in chunk]
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_18_ids_unique_across_processes(self):
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            results = pool.map(allocate_ids, range(4))
+        ids = [i for process in results for chunk in process for i in chunk]
+        self.assertEqual(len(ids), 4 * 4 * 5_000)
+        self.assertEqual(len(set(ids)), len(ids))
+        for process in results:
+            for chunk in process:
+                self.assertEqual(chunk, sorted(chunk))
+
+    def test_19_slots_are_recycled(self):
+        allocator = OrderIdAllocator()
+        for _ in range(3):
+            threads = [threading.Thread(target=allocator.nextid) for _ in range(64)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(allocator.freeslots), 63)  # the last slot is the shared overflow one
+
+    def test_20_placeorder_uses_allocator(self):
+        self.user.cart.addproduct(self.mouse, 1)
+        first = self.user.placeorder()
+        self.user.cart.addproduct(self.mouse, 1)
+        second = self.user.placeorder()
+        self.assertLess(first.orderid, second.orderid)
+
+    def test_21_placed_order_keeps_its_lines(self):
+        self.user.addtocart(self.user.cart, self.laptop, 1)
+        self.user.addtocart(self.user.cart, self.mouse, 2)
+        order = self.user.placeorder()
+        self.assertEqual(self.user.cart.products, {})
+        self.assertEqual(order.products, (OrderLine("P001", 1, 1000), OrderLine("P002", 2, 25)))
+        self.assertEqual(order.total, 1050)
+
+    def test_22_order_lines_ignore_later_changes(self):
+        self.user.cart.addproduct(self.laptop, 1)
+        order = self.user.placeorder()
+        self.laptop.price = 1
+        self.user.cart.addproduct(self.laptop, 3)
+        self.assertEqual(order.products, (OrderLine("P001", 1, 1000),))
+        self.assertIsInstance(order.products, tuple)
+
+    def payments(self, count):
+        return [Payment(Order({}, orderid), 10, "Credit Card") for orderid in range(count)]
+
+    def test_23_pipeline_runs_payments_concurrently(self):
+        gateway = FakePaymentGateway(latency=0.05)
+        pipeline = PaymentPipeline(gateway, concurrency=50)
+        payments = self.payments(100)
+        statuses = asyncio.run(pipeline.processmany(payments))
+        self.assertEqual(statuses, ['Completed'] * 100)
+        self.assertEqual(len(gateway.charges), 100)
+
+    def test_24_pipeline_retries_failures(self):
+        gateway = FakePaymentGateway(latency=0, failurerate=0.5, seed=1)
+        pipeline = PaymentPipeline(gateway, retries=10, backoff=0)
+        statuses = asyncio.run(pipeline.processmany(self.payments(50)))
+        self.assertEqual(statuses, ['Completed'] * 50)
+        self.assertGreater(gateway.calls, 50)
+
+    def test_25_pipeline_gives_up_after_retries(self):
+        gateway = FakePaymentGateway(latency=0, failurerate=1.0)
+        pipeline = PaymentPipeline(gateway, retries=2, backoff=0)
+        payment = self.payments(1)[0]
+        self.assertEqual(asyncio.run(pipeline.process(payment)), 'Failed')
+        self.assertEqual(payment.status, 'Failed')
+        self.assertEqual(gateway.calls, 3)
+
+    def test_26_pipeline_times_out_slow_gateway(self):
+        gateway = FakePaymentGateway(latency=1.0)
+        pipeline = PaymentPipeline(gateway, timeout=0.01, retries=1, backoff=0)
+        self.assertEqual(asyncio.run(pipeline.process(self.payments(1)[0])), 'Failed')
+        self.assertEqual(gateway.charges, {})
+
+    def test_27_duplicate_submissions_charge_once(self):
+        gateway = FakePaymentGateway(latency=0.01)
+        pipeline = PaymentPipeline(gateway)
+        order = Order({}, 42)
+        first, second = Payment(order, 10, "Credit Card"), Payment(order, 10, "Credit Card")
+
+        async def submit():
+            await pipeline.processmany([first, second])
+            return await pipeline.process(Payment(order, 10, "PayPal"))
+
+        self.assertEqual(asyncio.run(submit()), 'Completed')
+        self.assertEqual((first.status, second.status), ('Completed', 'Completed'))
+        self.assertEqual(gateway.calls, 1)
+
+    def build_catalog(self):
+        catalog = Catalog()
+        catalog.addproducts([self.laptop, self.mouse, Product("P003", "Mechanical Keyboard", 75, 50),
+                             Product("P004", "Laptop Stand", 40, 20)])
+        catalog.addproduct(Product("P005", "Wireless Mouse", 30, 80))
+        return catalog
+
+    def test_28_catalog_lookup_and_prefix(self):
+        catalog = self.build_catalog()
+        self.assertIs(catalog.getproduct("P002"), self.mouse)
+        self.assertIsNone(catalog.getproduct("P999"))
+        self.assertEqual([p.productID for p in catalog.prefixsearch("lap")], ["P001", "P004"])
+        self.assertEqual([p.productID for p in catalog.prefixsearch("LAPTOP S")], ["P004"])
+        self.assertEqual(catalog.prefixsearch("zzz"), [])
+        self.assertEqual(len(catalog.prefixsearch("", limit=3)), 3)
+
+    def test_29_catalog_keyword_search(self):
+        catalog = self.build_catalog()
+        self.assertEqual([p.productID for p in catalog.search("mouse")], ["P002", "P005"])
+        self.assertEqual([p.productID for p in catalog.search("wireless MOUSE")], ["P005"])
+        self.assertEqual(catalog.search("wireless keyboard"), [])
+        self.assertEqual(catalog.search("  "), [])
+
+    def test_30_catalog_price_range_follows_reprice(self):
+        catalog = self.build_catalog()
+        self.assertEqual([p.productID for p in catalog.pricerange(25, 40)], ["P002", "P005", "P004"])
+        self.mouse.price = 500
+        self.assertEqual([p.productID for p in catalog.pricerange(25, 40)], ["P005", "P004"])
+        self.assertEqual([p.productID for p in catalog.pricerange(400, 1000)], ["P002", "P001"])
+        self.assertEqual(len(catalog.prices), 5)
+
+    def test_31_catalog_rejects_duplicate_ids(self):
+        catalog = self.build_catalog()
+        with self.assertRaises(ValueError):
+            catalog.addproduct(Product("P001", "Another Laptop", 1, 1))
+
+    def record_session(self, log):
+        user = User("U100", "Logged User", "log@example.com", eventlog=log)
+        user.cart.addproduct(self.laptop, 1)
+        user.cart.addproduct(self.mouse, 3)
+        user.cart.removeproduct(self.mouse, 1)
+        order = user.placeorder()
+        Payment(order, order.total, "Credit Card").processpayment()
+        order.status = 'Shipped'
+        user.cart.addproduct(self.mouse, 1)
+        return user, order
+
+    def test_32_replay_rebuilds_carts_and_orders(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.log")
+            log = EventLog(path, batchsize=3)
+            user, order = self.record_session(log)
+            log.close()
+            projection = OrderProjection()
+            self.assertEqual(projection.tail(path), 8)
+            self.assertEqual(projection.carts["U100"], {"P002": 1})
+            rebuilt = projection.orders[order.orderid]
+            self.assertEqual(rebuilt["lines"], list(order.products))
+            self.assertEqual((rebuilt["status"], rebuilt["payment"]), ("Shipped", "Completed"))
+
+    def test_33_replica_tails_new_events(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.log")
+            log = EventLog(path, batchsize=1)
+            user = User("U100", "Logged User", "log@example.com", eventlog=log)
+            replica = OrderProjection()
+            user.cart.addproduct(self.mouse, 2)
+            self.assertEqual(replica.tail(path), 1)
+            self.assertEqual(replica.tail(path), 0)
+            user.placeorder()
+            self.assertEqual(replica.tail(path), 2)
+            self.assertNotIn("U100", replica.carts)
+            with open(path, "a") as f:
+                f.write('["ProductAdded", "U100"')  # a line still being written
+            self.assertEqual(replica.tail(path), 0)
+            log.close()
+
+    def test_34_snapshot_bounds_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.log")
+            snapshotpath = os.path.join(directory, "orders.snapshot")
+            log = EventLog(path)
+            user, order = self.record_session(log)
+            log.flush()
+            projection = OrderProjection(snapshotpath, snapshotevery=3)
+            projection.tail(path)
+            restored = OrderProjection.restore(snapshotpath)
+            self.assertEqual(restored.tail(path), 2)  # snapshot was taken after the 6th of 8 events
+            self.assertEqual(restored.carts, projection.carts)
+            self.assertEqual(restored.orders, projection.orders)
+            log.close()
+
+    def test_35_shared_allocator_gives_forked_workers_distinct_processes(self):
+        Order.idallocator.nextid()  # the parent has leased a slot and used its pid before forking
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            results = pool.map(allocate_order_ids, range(4))
+        processes = [process for process, _ in results]
+        self.assertEqual(len(set(processes)), 4)
+        self.assertNotIn(Order.idallocator.processid, processes)
+        ids = [i for _, chunk in results for i in chunk]
+        self.assertEqual(len(ids), 4 * 4 * 2_000)
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_36_event_log_concurrent_appends(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.log")
+            log = EventLog(path, batchsize=64)
+
+            def shopper(userid):
+                for i in range(5_000):
+                    log.append(ProductAdded(userid, f"P{i % 7}", 1, 10))
+
+            threads = [threading.Thread(target=shopper, args=(f"U{n}",)) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            log.close()
+            with open(path, encoding='utf-8') as f:
+                self.assertEqual(sum(1 for _ in f), 8 * 5_000)
+            projection = OrderProjection()
+            projection.tail(path)
+            for n in range(8):
+                self.assertEqual(sum(projection.carts[f"U{n}"].values()), 5_000)
+
+    def test_37_emptied_cart_has_no_float_drift(self):
+        cart = self.user.cart
+        pen, pad = Product("P003", "Pen", 0.1, 10), Product("P004", "Pad", 0.2, 10)
+        cart.addproduct(pen, 1)
+        cart.addproduct(pad, 1)
+        cart.removeproduct(pen, 1)
+        cart.removeproduct(pad, 1)
+        self.assertEqual(cart.subtotal, 0)
+
+    def test_38_product_carts_are_weak_and_pruned(self):
+        cart = self.user.cart
+        cart.addproduct(self.laptop, 1)
+        cart.addproduct(self.mouse, 1)
+        cart.removeproduct(self.mouse, 1)
+        self.assertNotIn(cart, self.mouse.carts)
+        cart.emptycart()
+        self.assertNotIn(cart, self.laptop.carts)
+        shopper = User("U002", "Jane Doe", "jane@example.com")
+        shopper.cart.addproduct(self.laptop, 1)
+        self.assertEqual(len(self.laptop.carts), 1)
+        del shopper
+        gc.collect()  # a User and its Cart reference each other
+        self.assertEqual(len(self.laptop.carts), 0)
+
+    def test_39_addproducts_rejects_duplicates_without_changes(self):
+        catalog = self.build_catalog()
+        batch = [Product("P006", "Desk Lamp", 20, 5), Product("P001", "Laptop", 900, 1)]
+        with self.assertRaises(ValueError):
+            catalog.addproducts(batch)
+        with self.assertRaises(ValueError):
+            catalog.addproducts([Product("P007", "Desk Mat", 15, 5), Product("P007", "Desk Mat", 15, 5)])
+        self.assertIsNone(catalog.getproduct("P006"))
+        self.assertIsNone(catalog.getproduct("P007"))
+        self.assertEqual(catalog.names, sorted(catalog.names))
+        self.assertEqual(catalog.prices, sorted(catalog.prices))
+        self.assertEqual([p.productID for p in catalog.pricerange(25, 40)], ["P002", "P005", "P004"])
+
+    def test_40_vieworderpage_without_store(self):
+        user = self.user
+        for _ in range(3):
+            user.cart.addproduct(self.mouse, 1)
+            user.placeorder()
+        self.assertIs(user.vieworder(), user.orders)
+        page, cursor = user.vieworderpage(limit=2)
+        self.assertEqual(page, user.orders[:0:-1])
+        user.cart.addproduct(self.mouse, 1)
+        user.placeorder()  # a new order does not shift the next page
+        self.assertEqual(user.vieworderpage(limit=2, cursor=cursor), (user.orders[:1], None))
+
+
+    def test_41_respawned_workers_never_run_out_of_ids(self):
+        # a pool that replaces its worker after every task forks far more than 2**NODE_BITS times
+        with multiprocessing.get_context("fork").Pool(2, maxtasksperchild=1) as pool:
+            results = pool.map(allocate_node_ids, [0] * 150 + [1] * 10, chunksize=1)
+        ids = [i for chunk in results for i in chunk]
+        self.assertEqual(len(ids), 160 * 100)
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_42_threads_beyond_the_slots_share_one(self):
+        allocator = OrderIdAllocator()
+        n_threads = (1 << OrderIdAllocator.SLOT_BITS) + 16
+        barrier = threading.Barrier(n_threads)  # every thread holds its slot at the same time
+        results = [[] for _ in range(n_threads)]
+
+        def worker(out):
+            barrier.wait()
+            for _ in range(500):
+                out.append(allocator.nextid())
+            barrier.wait()
+
+        threads = [threading.Thread(target=worker, args=(out,)) for out in results]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ids = [i for chunk in results for i in chunk]
+        self.assertEqual(len(ids), n_threads * 500)
+        self.assertEqual(len(set(ids)), len(ids))
+        for chunk in results:
+            self.assertEqual(chunk, sorted(chunk))
+
+
+    def test_43_pipeline_retries_network_errors_and_forgets_failures(self):
+        failures = [ConnectionResetError("reset by peer"), KeyError("gateway bug")]
+
+        class FlakyGateway(FakePaymentGateway):
+            async def authorize(self, idempotencykey, amount):
+                if failures:
+                    self.calls += 1
+                    raise failures.pop(0)
+                return await super().authorize(idempotencykey, amount)
+
+        gateway = FlakyGateway(latency=0)
+        pipeline = PaymentPipeline(gateway, retries=3, backoff=0)
+        order = Order({}, 7)
+        with self.assertRaises(KeyError):  # the reset is retried, an unexpected error is not
+            asyncio.run(pipeline.process(Payment(order, 10, "Credit Card")))
+        self.assertEqual(gateway.calls, 2)
+        self.assertEqual(pipeline.authorizations, {})
+        self.assertEqual(asyncio.run(pipeline.process(Payment(order, 10, "Credit Card"))), 'Completed')
+        self.assertEqual(gateway.calls, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,248 @@
+# Benchmarks for the Elevator System
+# Run: python bench_elevator_system.py
+
+import heapq
+import itertools
+import random
+import time
+import tracemalloc
+from elevatorsystemclass import (Elevator, GroupController, ParkingPolicy, PassengerTable, Request, RequestOrigin,
+                                 Simulation, State, Telemetry, ThreadedController)
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def hall_calls(count, floors, seed=7):
+    rng = random.Random(seed)
+    calls = []
+    for _ in range(count):
+        origin, destination = rng.sample(range(1, floors + 1), 2)
+        calls.append((origin, destination, State.UP if destination > origin else State.DOWN))
+    return calls
+
+# baseline dispatcher: hall calls go to the cars in turn, whatever they are doing
+class RoundRobinGroup(GroupController):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.turn = itertools.cycle(self.elevators)
+
+    def dispatch(self, request, direction):
+        elevator = next(self.turn)
+        elevator.add_request(request)
+        return elevator
+
+def bench_dispatch_rate():
+    print("== Dispatch decisions ==")
+    for num_cars in (4, 8, 16):
+        group = GroupController(num_cars, floor_time=1.5, door_time=4.0, simulation=Simulation())
+        calls = hall_calls(100_000, 50)
+
+        def run():
+            for origin, destination, direction in calls:
+                if direction == State.UP:
+                    group.send_up_request(origin, destination)
+                else:
+                    group.send_down_request(origin, destination)
+
+        _, elapsed = timed(run)
+        print(f"{num_cars:>2} cars: {len(calls) / elapsed:,.0f} decisions/sec")
+
+def bench_dispatch_wait(hours=4):
+    print(f"== Simulated average wait, {hours}h of random hall calls on 50 floors ==")
+    for num_cars, calls_per_hour in ((4, 150), (8, 300), (8, 500)):
+        waits = {}
+        for name, group_class in (("lowest-ETA", GroupController), ("round-robin", RoundRobinGroup)):
+            group = group_class(num_cars, floor_time=1.5, door_time=4.0, simulation=Simulation())
+            schedule_traffic(group, hours * 3600, calls_per_hour, 50)
+            group.handle_requests()
+            waits[name] = group.passengers.report()["average_wait"]
+        print(f"{num_cars:>2} cars, {calls_per_hour} calls/hour: lowest-ETA {waits['lowest-ETA']:6.1f}s, "
+              f"round-robin {waits['round-robin']:6.1f}s")
+
+# Poisson hall-call arrivals over `duration` seconds, scheduled straight onto the simulation's event queue
+def schedule_traffic(group, duration, calls_per_hour, floors, seed=11):
+    rng = random.Random(seed)
+    at, count = rng.expovariate(calls_per_hour / 3600), 0
+    while at < duration:
+        origin, destination = rng.sample(range(1, floors + 1), 2)
+        send = group.send_up_request if destination > origin else group.send_down_request
+        group.simulation.schedule_at(at, send, origin, destination)
+        at += rng.expovariate(calls_per_hour / 3600)
+        count += 1
+    return count
+
+def bench_day_simulation():
+    print("== 24h of a 50-floor building, as fast as possible ==")
+    for num_cars, calls_per_hour in ((4, 1_000), (8, 3_000), (16, 6_000)):
+        group = GroupController(num_cars, floor_time=1.5, door_time=4.0, simulation=Simulation())
+        calls = schedule_traffic(group, 24 * 3600, calls_per_hour, 50)
+        _, elapsed = timed(lambda: group.simulation.run(until=24 * 3600))
+        report = group.passengers.report()
+        print(f"{num_cars:>2} cars, {calls:>7,} calls: {elapsed:.2f}s wall, {group.simulation.processed:,} events, "
+              f"{24 * 3600 / elapsed:,.0f}x real time, wait {report['average_wait']:.1f}s avg / "
+              f"{report['max_wait']:.0f}s max, ride {report['average_ride']:.1f}s avg")
+
+def bench_passenger_table(count=500_000):
+    print(f"== Passenger state for {count:,} passengers ==")
+    tracemalloc.start()
+    table = PassengerTable()
+    for i in range(count):
+        table.add(i % 50, (i + 7) % 50, i % 8, float(i))
+    table_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    rows = [{"origin": i % 50, "destination": (i + 7) % 50, "car": i % 8, "requested_at": float(i),
+             "picked_up_at": None, "dropped_off_at": None} for i in range(count)]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"PassengerTable: {table_bytes / count:.0f} B/passenger, dict per passenger: {dict_bytes / len(rows):.0f} B/passenger")
+
+# the scheduling Elevator used before LOOK: drain every up request in destination order, then every
+# down request, wherever the car happens to be
+class DrainingElevator(Elevator):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.up_queue = []  # minheap
+        self.down_queue = []  # minheap
+
+    def add_up_request(self, request):
+        heapq.heappush(self.up_queue, request)
+        self.operate()
+
+    def add_down_request(self, request):
+        heapq.heappush(self.down_queue, request)
+        self.operate()
+
+    def next_stop(self):
+        if self.up_queue and (self.state != State.DOWN or not self.down_queue):
+            self.state = State.UP
+            self.move_to_floor(heapq.heappop(self.up_queue).destination_floor)
+        elif self.down_queue:
+            self.state = State.DOWN
+            self.move_to_floor(heapq.heappop(self.down_queue).destination_floor)
+        else:
+            self.busy = False
+            self.state = State.IDLE
+
+def travel_on_trace(elevator_class, calls, gap):
+    simulation = Simulation()
+    elevator = elevator_class(simulation=simulation)
+    for i, (origin, destination, direction) in enumerate(calls):
+        send = elevator.add_up_request if direction == State.UP else elevator.add_down_request
+        # destination-only car calls: the old scheduler never visited origins
+        simulation.schedule_at(i * gap, send, Request(RequestOrigin.INSIDE, origin, destination))
+    simulation.run()
+    return elevator.floors_travelled, simulation.now
+
+def bench_look_scheduling():
+    print("== Travel distance, one car, 2,000 random calls on 50 floors ==")
+    for gap in (0.5, 5.0, 20.0):
+        calls = hall_calls(2_000, 50, seed=int(gap * 10))
+        old, old_time = travel_on_trace(DrainingElevator, calls, gap)
+        look, look_time = travel_on_trace(Elevator, calls, gap)
+        print(f"call every {gap:>4}s: up-then-down {old:>7,} floors ({old_time:,.0f}s), "
+              f"LOOK {look:>7,} floors ({look_time:,.0f}s), {1 - look / old:.0%} less travel")
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6
+    return f"p50 {pick(0.50):7.1f}us, p99 {pick(0.99):8.1f}us, max {ordered[-1] * 1e6:9.1f}us"
+
+def bench_threaded_submission(rate=10_000, seconds=2.0):
+    print(f"== ThreadedController, {rate:,} calls/sec for {seconds:.0f}s, 8 cars on 50 floors ==")
+    group = GroupController(8, floor_time=1.5, door_time=4.0, simulation=Simulation())
+    controller = ThreadedController(group, speed=10).start()
+    calls = hall_calls(int(rate * seconds), 50)
+    submit_times = []
+    start = time.perf_counter()
+    for i, (origin, destination, _) in enumerate(calls):
+        # sleep rather than spin so the caller does not hold the GIL away from the worker
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        before = time.perf_counter()
+        controller.submit(origin, destination)
+        submit_times.append(time.perf_counter() - before)
+    controller.stop(drain=False)
+    print(f"submit():             {percentiles(submit_times)}")
+    print(f"submit -> dispatched: {percentiles(controller.dispatch_latencies)}")
+
+# synthetic office traffic, as (time, origin, destination): an up-peak from the lobby 08:00-10:00,
+# a down-peak to the lobby 17:00-19:00 and light interfloor traffic the rest of the day
+def office_trace(days, floors, peak_calls=120, seed=5):
+    rng = random.Random(seed)
+    trace = []
+    for day in range(days):
+        for hour in range(24):
+            if 8 <= hour < 10:
+                pattern, calls = "up", peak_calls
+            elif 17 <= hour < 19:
+                pattern, calls = "down", peak_calls
+            elif 7 <= hour < 20:
+                pattern, calls = "interfloor", 30
+            else:
+                pattern, calls = "interfloor", 4
+            for _ in range(calls):
+                at = (day * 24 + hour) * 3600 + rng.random() * 3600
+                if pattern == "up" and rng.random() < 0.9:
+                    origin, destination = 1, rng.randint(2, floors)
+                elif pattern == "down" and rng.random() < 0.9:
+                    origin, destination = rng.randint(2, floors), 1
+                else:
+                    origin, destination = rng.sample(range(1, floors + 1), 2)
+                trace.append((at, origin, destination))
+    trace.sort()
+    return trace
+
+def run_trace(trace, num_cars, floors, parking):
+    policy = ParkingPolicy(floors) if parking else None
+    group = GroupController(num_cars, floor_time=1.5, door_time=4.0, simulation=Simulation(),
+                            parking=policy)
+    for at, origin, destination in trace:
+        send = group.send_up_request if destination > origin else group.send_down_request
+        group.simulation.schedule_at(at, send, origin, destination)
+    group.handle_requests()
+    return group.passengers
+
+def average_wait(passengers, start, end):
+    waits = [passengers.wait_time(i) for i in range(len(passengers)) if start <= passengers.requested_at[i] < end]
+    return sum(waits) / len(waits)
+
+def bench_parking(days=5, floors=30, num_cars=4):
+    print(f"== Idle parking, {days} office days on {floors} floors, {num_cars} cars, average wait on the last day ==")
+    last = (days - 1) * 86400
+    windows = (("up-peak 08-10", 8, 10), ("down-peak 17-19", 17, 19), ("off-peak 10-17", 10, 17), ("whole day", 0, 24))
+    for peak_calls in (60, 120, 240):
+        print(f"-- {peak_calls} calls/hour at peak --")
+        trace = office_trace(days, floors, peak_calls)
+        results = {parking: run_trace(trace, num_cars, floors, parking) for parking in (False, True)}
+        for name, start, end in windows:
+            stay = average_wait(results[False], last + start * 3600, last + end * 3600)
+            park = average_wait(results[True], last + start * 3600, last + end * 3600)
+            print(f"{name:<16} stay where idle {stay:6.1f}s, learned parking {park:6.1f}s ({park / stay - 1:+.0%})")
+
+def bench_telemetry_overhead():
+    print("== Telemetry overhead, 24h of 8 cars on 50 floors ==")
+    for label, make in (("telemetry=None", lambda: None), ("Telemetry()", lambda: Telemetry(8))):
+        runs = []
+        for _ in range(3):
+            telemetry = make()
+            group = GroupController(8, floor_time=1.5, door_time=4.0, simulation=Simulation(), telemetry=telemetry)
+            schedule_traffic(group, 24 * 3600, 500, 50)
+            runs.append(timed(lambda: group.simulation.run(until=24 * 3600))[1])
+        print(f"{label:<15} best of 3: {min(runs):.2f}s wall, {group.simulation.processed:,} events")
+    snapshot = telemetry.snapshot(group.simulation.now)
+    print(f"mean utilization {sum(snapshot['utilization']) / 8:.0%}, "
+          f"mean wait {snapshot['wait_seconds']['sum'] / snapshot['wait_seconds']['count']:.1f}s")
+
+if __name__ == "__main__":
+    bench_dispatch_rate()
+    bench_dispatch_wait()
+    bench_day_simulation()
+    bench_look_scheduling()
+    bench_passenger_table()
+    bench_threaded_submission()
+    bench_parking()
+    bench_telemetry_overhead()
@@ -2,8 +2,14 @@
 # Problem: Simulate an elevator system that handles multiple requests, directions, and floors.
 # Concepts: State management, scheduling
 
-from collections import deque
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, deque
 import heapq
+import itertools
+import math
+import queue
+import threading
 import time
 from enum import Enum
 
@@ -21,83 +27,700 @@ class Request:
         self.origin = origin
         self.origin_floor = origin_floor
         self.destination_floor = destination_floor
+        self.passenger_id = None  # set once a car accepts the request
 
     def __lt__(self, other):
         return self.destination_floor < other.destination_floor
 
+# Discrete-event engine: a virtual clock plus a priority queue of (time, seq, callback, args).
+# realtime=True sleeps between events (scaled by speed) so the same logic can run live
+class Simulation:
+    def __init__(self, realtime=False, speed=1.0):
+        self.now = 0.0
+        self.realtime = realtime
+        self.speed = speed
+        self.events = []  # minheap
+        self.sequence = itertools.count()  # tie-break, keeps same-time events in scheduling order
+        self.processed = 0
+
+    def schedule(self, delay, callback, *args):
+        heapq.heappush(self.events, (self.now + delay, next(self.sequence), callback, args))
+
+    def schedule_at(self, at, callback, *args):
+        heapq.heappush(self.events, (at, next(self.sequence), callback, args))
+
+    def step(self):
+        at, _, callback, args = heapq.heappop(self.events)
+        if self.realtime and at > self.now:
+            time.sleep((at - self.now) / self.speed)
+        self.now = at
+        self.processed += 1
+        callback(*args)
+
+    # run until the queue drains or the clock would pass `until`
+    def run(self, until=None):
+        while self.events and (until is None or self.events[0][0] <= until):
+            self.step()
+        if until is not None and self.now < until:
+            self.now = until
+
+# time models: plain callables so a car can take any function of (from_floor, to_floor) / ()
+class ConstantTravelTime:
+    def __init__(self, floor_time=1.0, start_stop_time=0.0):
+        self.floor_time = floor_time  # seconds per floor at speed
+        self.start_stop_time = start_stop_time  # fixed cost to get going and level off
+
+    def __call__(self, from_floor, to_floor):
+        if from_floor == to_floor:
+            return 0.0
+        return self.start_stop_time + abs(to_floor - from_floor) * self.floor_time
+
+# trapezoidal speed profile: accelerate, cruise at max_speed if the trip is long enough, decelerate
+class KinematicTravelTime:
+    def __init__(self, floor_height=3.5, max_speed=2.5, acceleration=1.0):
+        self.floor_height = floor_height  # metres
+        self.max_speed = max_speed  # m/s
+        self.acceleration = acceleration  # m/s^2
+
+    def __call__(self, from_floor, to_floor):
+        distance = abs(to_floor - from_floor) * self.floor_height
+        ramp = self.max_speed * self.max_speed / self.acceleration  # metres spent speeding up + slowing down
+        if distance >= ramp:
+            return 2 * self.max_speed / self.acceleration + (distance - ramp) / self.max_speed
+        return 2 * (distance / self.acceleration) ** 0.5
+
+class FixedDoorTime:
+    def __init__(self, seconds=1.0):
+        self.seconds = seconds  # open, dwell and close
+
+    def __call__(self):
+        return self.seconds
+
+# Per-passenger state in parallel typed arrays indexed by passenger id, so a long simulation
+# costs a few dozen bytes per passenger instead of an object each. Times are NaN until they happen
+class PassengerTable:
+    def __init__(self):
+        self.origin = array('i')
+        self.destination = array('i')
+        self.car = array('i')
+        self.requested_at = array('d')
+        self.picked_up_at = array('d')
+        self.dropped_off_at = array('d')
+
+    def __len__(self):
+        return len(self.origin)
+
+    def add(self, origin, destination, car_id, requested_at):
+        self.origin.append(origin)
+        self.destination.append(destination)
+        self.car.append(car_id)
+        self.requested_at.append(requested_at)
+        self.picked_up_at.append(math.nan)
+        self.dropped_off_at.append(math.nan)
+        return len(self.origin) - 1
+
+    def wait_time(self, passenger_id):
+        return self.picked_up_at[passenger_id] - self.requested_at[passenger_id]
+
+    def ride_time(self, passenger_id):
+        return self.dropped_off_at[passenger_id] - self.picked_up_at[passenger_id]
+
+    # averages and worst case over passengers who have been picked up / dropped off
+    def report(self):
+        waits = [picked - requested for requested, picked in zip(self.requested_at, self.picked_up_at)
+                 if not math.isnan(picked)]
+        rides = [dropped - picked for picked, dropped in zip(self.picked_up_at, self.dropped_off_at)
+                 if not math.isnan(dropped)]
+        return {
+            "passengers": len(self),
+            "picked_up": len(waits),
+            "delivered": len(rides),
+            "average_wait": sum(waits) / len(waits) if waits else 0.0,
+            "max_wait": max(waits, default=0.0),
+            "average_ride": sum(rides) / len(rides) if rides else 0.0,
+            "max_ride": max(rides, default=0.0),
+        }
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds  # upper bounds, ascending; one extra bucket catches the rest
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        return list(itertools.accumulate(self.counts))
+
+# Counters per car, wait/ride histograms and busy time. Cars call in only when one is attached,
+# so with telemetry=None the cost is a single attribute check per event
+class Telemetry:
+    SECONDS = (5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+
+    def __init__(self, num_cars=1, bounds=SECONDS):
+        self.stops = [0] * num_cars
+        self.floors_travelled = [0] * num_cars
+        self.door_cycles = [0] * num_cars
+        self.busy_time = [0.0] * num_cars
+        self.busy_since = [None] * num_cars
+        self.wait = Histogram(bounds)
+        self.ride = Histogram(bounds)
+
+    # grow the per-car counters so car ids up to num_cars - 1 can report
+    def ensure_cars(self, num_cars):
+        extra = num_cars - len(self.stops)
+        if extra > 0:
+            self.stops += [0] * extra
+            self.floors_travelled += [0] * extra
+            self.door_cycles += [0] * extra
+            self.busy_time += [0.0] * extra
+            self.busy_since += [None] * extra
+
+    def stop(self, car_id, floors):
+        self.stops[car_id] += 1
+        self.floors_travelled[car_id] += floors
+
+    # a leg that ends without stopping, like an idle car reaching its parking floor
+    def pass_through(self, car_id, floors):
+        self.floors_travelled[car_id] += floors
+
+    def door_cycle(self, car_id):
+        self.door_cycles[car_id] += 1
+
+    def car_busy(self, car_id, now):
+        if self.busy_since[car_id] is None:
+            self.busy_since[car_id] = now
+
+    def car_idle(self, car_id, now):
+        if self.busy_since[car_id] is not None:
+            self.busy_time[car_id] += now - self.busy_since[car_id]
+            self.busy_since[car_id] = None
+
+    # share of [0, now] each car spent moving or with doors open
+    def utilization(self, now):
+        return [(busy + (now - since if since is not None else 0.0)) / now if now > 0 else 0.0
+                for busy, since in zip(self.busy_time, self.busy_since)]
+
+    def snapshot(self, now):
+        def histogram(h):
+            return {"buckets": dict(zip([*h.bounds, "+Inf"], h.cumulative())), "sum": h.total, "count": h.count}
+        return {
+            "stops": list(self.stops),
+            "floors_travelled": list(self.floors_travelled),
+            "door_cycles": list(self.door_cycles),
+            "utilization": self.utilization(now),
+            "wait_seconds": histogram(self.wait),
+            "ride_seconds": histogram(self.ride),
+        }
+
+    # Prometheus text exposition format
+    def prometheus(self, now):
+        lines = []
+        for name, help_text, values in (("elevator_stops_total", "Stops made.", self.stops),
+                                        ("elevator_floors_travelled_total", "Floors travelled.", self.floors_travelled),
+                                        ("elevator_door_cycles_total", "Door open/close cycles.", self.door_cycles)):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{car="{car}"}} {value}' for car, value in enumerate(values)]
+        lines += ["# HELP elevator_utilization Share of time the car was busy.", "# TYPE elevator_utilization gauge"]
+        lines += [f'elevator_utilization{{car="{car}"}} {value:.6f}' for car, value in enumerate(self.utilization(now))]
+        for name, help_text, h in (("elevator_wait_seconds", "Hall call to pickup.", self.wait),
+                                   ("elevator_ride_seconds", "Pickup to dropoff.", self.ride)):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            lines += [f'{name}_bucket{{le="{bound}"}} {count}' for bound, count in zip([*h.bounds, "+Inf"], h.cumulative())]
+            lines += [f"{name}_sum {h.total}", f"{name}_count {h.count}"]
+        return "\n".join(lines) + "\n"
+
 class Elevator:
-    def __init__(self, current_floor=1):
+    def __init__(self, current_floor=1, car_id=0, simulation=None, travel_time=None, door_time=None, telemetry=None,
+                 passengers=None):
+        self.car_id = car_id
+        self.simulation = simulation or Simulation(realtime=True)
+        self.passengers = passengers if passengers is not None else PassengerTable()
+        # two-phase requests: passenger ids waiting at their origin, and riding to their destination
+        self.waiting = defaultdict(list)
+        self.riding = defaultdict(list)
+        self.travel_time = travel_time or ConstantTravelTime()
+        self.door_time = door_time or FixedDoorTime()
+        self.telemetry = telemetry  # None turns instrumentation off
+        self.busy = False  # moving or doors open; new requests join the running sweep
         self.current_floor = current_floor  # current floor
         self.state = State.IDLE  # begin state
-        self.up_queue = []  # minheap
-        self.down_queue = []  # minheap
+        # LOOK scheduling: stops served on the way up wait in up_stops, on the way down in down_stops,
+        # each a heap ordered the way the car will reach them plus a set to merge duplicates
+        self.up_stops = []  # minheap
+        self.down_stops = []  # minheap of -floor
+        self.up_floors = set()
+        self.down_floors = set()
+        self.floors_travelled = 0
+        # the leg in flight: where it started, when, and where it is headed. Arrival events carry the
+        # leg number so a leg cut short for a stop on the way leaves its old arrival to be ignored
+        self.leg = 0
+        self.leg_from = current_floor
+        self.leg_started_at = 0.0
+        self.target = None
+        self.parking_floor = None  # where an idle car is headed to wait for the next call
+        self.on_idle = None  # callback(elevator) when the car runs out of stops
+        # kept up to date on every add so dispatch can estimate arrival times in O(1)
+        self.highest_stop = None
+        self.lowest_stop = None
 
     # open elevator
     def open_doors(self):
-        print(f"Doors are OPEN on floor {self.current_floor}")
+        if self.telemetry is not None:
+            self.telemetry.door_cycle(self.car_id)
 
-    # close elevator
+    # close elevator; the door cycle is already counted on open, kept as a hook for subclasses
     def close_doors(self):
-        print(f"Doors are CLOSED")
+        pass
 
     # up request to queue
     def add_up_request(self, request):
-        heapq.heappush(self.up_queue, request)
+        return self.add_request(request)
 
     # down request to queue
     def add_down_request(self, request):
-        heapq.heappush(self.down_queue, request)
+        return self.add_request(request)
+
+    # a hall call (OUTSIDE) stops at the origin first and the destination becomes a car call on
+    # boarding; a car call (INSIDE) is a passenger already on board. Returns the passenger id
+    def add_request(self, request):
+        now = self.simulation.now
+        if request.origin == RequestOrigin.INSIDE:
+            passenger_id = self.passengers.add(self.current_floor, request.destination_floor, self.car_id, now)
+            self.passengers.picked_up_at[passenger_id] = now
+            self.riding[request.destination_floor].append(passenger_id)
+            self.add_stop(request.destination_floor)
+        else:
+            passenger_id = self.passengers.add(request.origin_floor, request.destination_floor, self.car_id, now)
+            self.waiting[request.origin_floor].append(passenger_id)
+            going_up = request.destination_floor > request.origin_floor
+            self.add_stop(request.origin_floor, State.UP if going_up else State.DOWN)
+        request.passenger_id = passenger_id
+        self.track_stop(request)
+        self.operate()
+        return passenger_id
+
+    # file a stop for the sweep in `direction` (hall calls), or by where it is relative to the car
+    # (car calls); O(log n), and a floor already queued for that sweep is merged
+    def add_stop(self, floor, direction=None):
+        if direction is None:
+            going_up = floor > self.current_floor or (floor == self.current_floor and self.state != State.DOWN)
+            direction = State.UP if going_up else State.DOWN
+        if floor == self.target or self.stop_on_the_way(floor, direction):
+            return
+        if direction == State.UP:
+            if floor not in self.up_floors:
+                self.up_floors.add(floor)
+                heapq.heappush(self.up_stops, floor)
+        elif floor not in self.down_floors:
+            self.down_floors.add(floor)
+            heapq.heappush(self.down_stops, -floor)
+
+    def track_stop(self, request):
+        for floor in (request.origin_floor, request.destination_floor):
+            if floor is None:
+                continue
+            if self.highest_stop is None or floor > self.highest_stop:
+                self.highest_stop = floor
+            if self.lowest_stop is None or floor < self.lowest_stop:
+                self.lowest_stop = floor
+
+    # queued stops plus the one the car is driving to (a parking leg is not a stop)
+    def pending_stops(self):
+        in_flight = self.target is not None and self.target != self.parking_floor
+        return len(self.up_floors) + len(self.down_floors) + in_flight
+
+    # where the car is now: part way along the leg in flight, assuming floor_time per floor
+    def position(self, floor_time=1.0):
+        if self.target is None:
+            return self.current_floor
+        travelled = min(abs(self.target - self.leg_from), (self.simulation.now - self.leg_started_at) / floor_time)
+        return self.leg_from + travelled if self.target > self.leg_from else self.leg_from - travelled
+
+    # estimated seconds until this car can reach `floor` for a hall call going `direction`,
+    # from its direction, position, the extent of its pending stops and how many stops it has to make
+    def estimate_arrival(self, floor, direction, floor_time=1.0, door_time=1.0):
+        position = self.position(floor_time)
+        if not self.pending_stops():
+            return abs(floor - position) * floor_time
+        heading = self.state
+        if heading == State.IDLE:
+            heading = State.UP if self.up_stops else State.DOWN
+        top, bottom = position, position
+        for extent in (self.highest_stop, self.lowest_stop, self.target):
+            if extent is not None:
+                top, bottom = max(top, extent), min(bottom, extent)
+        if heading == State.UP:
+            if direction == State.UP and floor >= position:
+                distance = floor - position
+            elif direction == State.DOWN:
+                top = max(top, floor)
+                distance = (top - position) + (top - floor)
+            else:  # up call behind the car: finish the sweep, come down, then go back up
+                bottom = min(bottom, floor)
+                distance = (top - position) + (top - bottom) + (floor - bottom)
+        else:
+            if direction == State.DOWN and floor <= position:
+                distance = position - floor
+            elif direction == State.UP:
+                bottom = min(bottom, floor)
+                distance = (position - bottom) + (floor - bottom)
+            else:
+                top = max(top, floor)
+                distance = (position - bottom) + (top - bottom) + (top - floor)
+        return distance * floor_time + self.pending_stops() * door_time
+
+    # wake an idle car; the first stop is chosen when the event fires so requests
+    # added in the same instant are all seen before the car picks a direction
+    def operate(self):
+        if not self.busy:
+            self.busy = True
+            if self.telemetry is not None:
+                self.telemetry.car_busy(self.car_id, self.simulation.now)
+            self.simulation.schedule(0, self.next_stop)
 
-    def process_up_requests(self):
-        while self.up_queue:
-            request = heapq.heappop(self.up_queue)
-            self.move_to_floor(request.destination_floor)
+    # LOOK: serve the nearest stop ahead in the current direction and turn around only
+    # when nothing is left ahead, so stops are picked up on the way
+    def next_stop(self):
+        while True:
+            if self.up_stops and (self.state != State.DOWN or not self.down_stops):
+                direction, floor = State.UP, heapq.heappop(self.up_stops)
+                self.up_floors.discard(floor)
+            elif self.down_stops:
+                direction, floor = State.DOWN, -heapq.heappop(self.down_stops)
+                self.down_floors.discard(floor)
+            else:
+                self.busy = False
+                self.state = State.IDLE  # done and idle
+                self.highest_stop = self.lowest_stop = None
+                if self.telemetry is not None:
+                    self.telemetry.car_idle(self.car_id, self.simulation.now)
+                if self.on_idle:
+                    self.on_idle(self)
+                return
+            # added while the car was already past it on its last leg: re-file it behind the car
+            if (direction == State.UP and floor < self.current_floor) or (direction == State.DOWN and floor > self.current_floor):
+                self.add_stop(floor)
+                continue
+            self.state = direction
+            self.move_to_floor(floor)
+            return
 
-    def process_down_requests(self):
-        while self.down_queue:
-            request = heapq.heappop(self.down_queue)
-            self.move_to_floor(request.destination_floor)
+    # a stop between the car and the end of the leg it is travelling, that it has not yet passed,
+    # shortens the leg; the old target goes back into the stop set
+    def stop_on_the_way(self, floor, direction):
+        if self.target is None or direction != self.state:
+            return False
+        if not (self.leg_from < floor < self.target or self.target < floor < self.leg_from):
+            return False
+        remaining = self.leg_started_at + self.travel_time(self.leg_from, floor) - self.simulation.now
+        if remaining < 0:
+            return False
+        previous, self.target = self.target, None
+        self.floors_travelled -= abs(previous - floor)
+        self.add_stop(previous, direction)
+        self.start_leg(floor, remaining)
+        return True
 
     def move_to_floor(self, floor):
-        if self.current_floor != floor:
-            print(f"Moving from floor {self.current_floor} to floor {floor}")
-            time.sleep(1)  # Simulate movement time
-            self.current_floor = floor
-            print(f"Arrived at floor {floor}")
+        self.floors_travelled += abs(floor - self.current_floor)
+        self.leg_from = self.current_floor
+        self.leg_started_at = self.simulation.now
+        self.start_leg(floor, self.travel_time(self.current_floor, floor))
+
+    def start_leg(self, floor, duration):
+        self.leg += 1
+        self.target = floor
+        self.simulation.schedule(duration, self.arrive, floor, self.leg)
+
+    # an idle car moving to wait somewhere else; it travels without stopping and opens no doors
+    def park(self, floor):
+        if self.busy or floor == self.current_floor:
+            return
+        self.busy = True
+        if self.telemetry is not None:
+            self.telemetry.car_busy(self.car_id, self.simulation.now)
+        self.parking_floor = floor
+        self.state = State.UP if floor > self.current_floor else State.DOWN
+        self.move_to_floor(floor)
+
+    def arrive(self, floor, leg):
+        if leg != self.leg:
+            return
+        self.target = None
+        floors = abs(floor - self.leg_from)
+        self.current_floor = floor
+        if floor == self.parking_floor:
+            self.parking_floor = None
+            if floor not in self.riding and floor not in self.waiting:
+                if self.telemetry is not None:
+                    self.telemetry.pass_through(self.car_id, floors)
+                self.next_stop()
+                return
+        if self.telemetry is not None:
+            self.telemetry.stop(self.car_id, floors)
         self.open_doors()
-        time.sleep(1)  # Simulate door open time
-        self.close_doors()
+        self.exchange_passengers(floor)
+        self.simulation.schedule(self.door_time(), self.depart)
 
-    def operate(self):
-        if self.up_queue or self.state == State.UP:
-            print("Processing UP requests...")
-            self.process_up_requests()
-        if self.down_queue or self.state == State.DOWN:
-            print("Processing DOWN requests...")
-            self.process_down_requests()
-        self.state = State.IDLE  # done and idle
-        print("Elevator is now IDLE.")
+    # riders for this floor get off, then passengers going the car's way get on and their destination
+    # is queued. Those going the other way board only if the car turns around here, otherwise the
+    # floor is queued again for the opposite sweep
+    def exchange_passengers(self, floor):
+        now = self.simulation.now
+        passengers = self.passengers
+        telemetry = self.telemetry
+        for passenger_id in self.riding.pop(floor, ()):
+            passengers.dropped_off_at[passenger_id] = now
+            if telemetry is not None:
+                telemetry.ride.observe(now - passengers.picked_up_at[passenger_id])
+        waiting = self.waiting.pop(floor, None)
+        if not waiting:
+            return
+        heading = self.state
+        opposite = []
+        for passenger_id in waiting:
+            going_up = passengers.destination[passenger_id] > floor
+            if heading == State.IDLE or going_up == (heading == State.UP):
+                self.board(passenger_id, now)
+            else:
+                opposite.append(passenger_id)
+        if opposite:
+            if self.up_stops if heading == State.UP else self.down_stops:
+                self.waiting[floor] = opposite
+                self.add_stop(floor, State.DOWN if heading == State.UP else State.UP)
+            else:
+                for passenger_id in opposite:
+                    self.board(passenger_id, now)
+
+    def board(self, passenger_id, now):
+        self.passengers.picked_up_at[passenger_id] = now
+        if self.telemetry is not None:
+            self.telemetry.wait.observe(now - self.passengers.requested_at[passenger_id])
+        destination = self.passengers.destination[passenger_id]
+        self.riding[destination].append(passenger_id)
+        self.add_stop(destination)
+
+    def depart(self):
+        self.close_doors()
+        self.next_stop()
 
 class Controller:
-    def __init__(self):
-        self.elevator = Elevator()
+    def __init__(self, simulation=None, telemetry=None):
+        self.simulation = simulation or Simulation(realtime=True)
+        self.passengers = PassengerTable()
+        self.telemetry = telemetry
+        self.elevator = Elevator(simulation=self.simulation, telemetry=telemetry, passengers=self.passengers)
 
     def send_up_request(self, origin_floor, destination_floor):
         request = Request(RequestOrigin.OUTSIDE, origin_floor, destination_floor)
-        self.elevator.add_up_request(request)
+        return self.elevator.add_up_request(request)
 
     def send_down_request(self, origin_floor, destination_floor):
         request = Request(RequestOrigin.OUTSIDE, origin_floor, destination_floor)
-        self.elevator.add_down_request(request)
+        return self.elevator.add_down_request(request)
+
+    # button pressed inside the car
+    def send_inside_request(self, destination_floor):
+        request = Request(RequestOrigin.INSIDE, self.elevator.current_floor, destination_floor)
+        return self.elevator.add_request(request)
 
     # start processing
     def handle_requests(self):
-        self.elevator.operate()
+        self.simulation.run()
+
+# Hall calls per (time-of-day bucket, floor) as exponentially decayed counts, so old days fade out
+# without ever sweeping the table: each cell stores its weight and when it was last touched,
+# and both record() and weight() are O(1)
+class DemandHistogram:
+    def __init__(self, floors, bucket_seconds=900, half_life=7 * 86400):
+        self.floors = floors
+        self.bucket_seconds = bucket_seconds
+        self.buckets = math.ceil(86400 / bucket_seconds)
+        self.decay = math.log(2) / half_life
+        cells = self.buckets * (floors + 1)  # floors are 1-based, column 0 unused
+        self.weights = array('d', bytes(8 * cells))
+        self.stamps = array('d', bytes(8 * cells))
+
+    def cell(self, floor, at):
+        return int(at % 86400 // self.bucket_seconds) * (self.floors + 1) + floor
+
+    def record(self, floor, now):
+        if not 1 <= floor <= self.floors:  # an out-of-range floor would land in another bucket's cells
+            raise ValueError(f"floor {floor} is outside 1..{self.floors}")
+        i = self.cell(floor, now)
+        self.weights[i] = self.weights[i] * math.exp(self.decay * (self.stamps[i] - now)) + 1.0
+        self.stamps[i] = now
+
+    # decayed count for the bucket `at` falls in, as seen at `now`
+    def weight(self, floor, at, now=None):
+        i = self.cell(floor, at)
+        return self.weights[i] * math.exp(self.decay * (self.stamps[i] - (at if now is None else now)))
+
+# Idle-car parking learned from where hall calls come from at this time of day. Floors are
+# ranked on demand in the current bucket plus the next one, so cars get there ahead of a peak
+class ParkingPolicy:
+    def __init__(self, floors, bucket_seconds=900, half_life=7 * 86400):
+        self.histogram = DemandHistogram(floors, bucket_seconds, half_life)
+
+    def record(self, floor, now):
+        self.histogram.record(floor, now)
+
+    def ranked_floors(self, now, count):
+        histogram = self.histogram
+        upcoming = now + histogram.bucket_seconds
+        scores = ((histogram.weight(floor, now) + histogram.weight(floor, upcoming, now), floor)
+                  for floor in range(1, histogram.floors + 1))
+        return [floor for score, floor in heapq.nlargest(count, scores) if score > 0]
+
+# Group dispatcher for a bank of cars: each hall call goes to the car with the lowest estimated arrival
+class GroupController:
+    def __init__(self, num_cars, floor_time=1.0, door_time=1.0, start_floor=1, simulation=None, parking=None,
+                 telemetry=None):
+        self.simulation = simulation or Simulation(realtime=True)
+        self.floor_time = floor_time  # seconds to travel one floor
+        self.door_time = door_time  # seconds per stop
+        self.passengers = PassengerTable()
+        if telemetry is not None:
+            telemetry.ensure_cars(num_cars)
+        self.elevators = [Elevator(start_floor, car_id, self.simulation, ConstantTravelTime(floor_time),
+                                   FixedDoorTime(door_time), telemetry, self.passengers) for car_id in range(num_cars)]
+        self.telemetry = telemetry
+        self.parking = parking
+        if parking is not None:
+            for elevator in self.elevators:
+                elevator.on_idle = self.park
+
+    # send a car that just went idle to the likeliest demand floor no other idle car is covering
+    def park(self, elevator):
+        covered = set()
+        for car in self.elevators:
+            if car is not elevator:
+                if car.parking_floor is not None:
+                    covered.add(car.parking_floor)
+                elif not car.busy:
+                    covered.add(car.current_floor)
+        for floor in self.parking.ranked_floors(self.simulation.now, len(self.elevators)):
+            if floor not in covered:
+                elevator.park(floor)
+                return
+
+    def dispatch(self, request, direction):
+        if self.parking is not None and request.origin == RequestOrigin.OUTSIDE:
+            self.parking.record(request.origin_floor, self.simulation.now)
+        elevator = min(self.elevators, key=lambda car: car.estimate_arrival(
+            request.origin_floor, direction, self.floor_time, self.door_time))
+        if direction == State.UP:
+            elevator.add_up_request(request)
+        else:
+            elevator.add_down_request(request)
+        return elevator
+
+    # hall calls return the passenger id; passengers.car says which car took it
+    def send_up_request(self, origin_floor, destination_floor):
+        request = Request(RequestOrigin.OUTSIDE, origin_floor, destination_floor)
+        self.dispatch(request, State.UP)
+        return request.passenger_id
+
+    def send_down_request(self, origin_floor, destination_floor):
+        request = Request(RequestOrigin.OUTSIDE, origin_floor, destination_floor)
+        self.dispatch(request, State.DOWN)
+        return request.passenger_id
+
+    def send_inside_request(self, car_id, destination_floor):
+        elevator = self.elevators[car_id]
+        return elevator.add_request(Request(RequestOrigin.INSIDE, elevator.current_floor, destination_floor))
+
+    def handle_requests(self):
+        self.simulation.run()
+
+# Event-loop front end for a GroupController: callers on any thread submit() and return at once,
+# a single worker thread owns the cars and the simulation, paces virtual time against the wall
+# clock (speed x real time) and feeds each call into whatever sweep is running
+class ThreadedController:
+    def __init__(self, group, speed=1.0):
+        if group.simulation.realtime:
+            raise ValueError("the worker paces the simulation itself; give the group a Simulation()")
+        self.group = group
+        self.speed = speed
+        self.inbox = queue.SimpleQueue()  # unbounded, put() never blocks
+        self.dispatch_latencies = array('d')  # seconds from submit() to dispatch, worker thread only
+        self.errors = []  # (item, exception) for each call the group rejected, worker thread only
+        self.failure = None  # what killed the worker, re-raised by stop()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.worker.start()
+        return self
+
+    def submit(self, origin_floor, destination_floor):
+        self.inbox.put((time.monotonic(), None, origin_floor, destination_floor))
+
+    def submit_inside(self, car_id, destination_floor):
+        self.inbox.put((time.monotonic(), car_id, None, destination_floor))
+
+    # drain=True lets the cars finish every passenger already accepted, as fast as possible
+    def stop(self, drain=True):
+        self.inbox.put(None)
+        self.worker.join()
+        if self.failure is not None:
+            raise Exception("the controller worker died, later calls were not dispatched") from self.failure
+        if drain:
+            self.group.simulation.run()
+
+    def virtual_now(self):
+        return (time.monotonic() - self.started_at) * self.speed
+
+    def handle(self, item):
+        submitted_at, car_id, origin_floor, destination_floor = item
+        try:
+            if car_id is not None:
+                self.group.send_inside_request(car_id, destination_floor)
+            elif destination_floor > origin_floor:
+                self.group.send_up_request(origin_floor, destination_floor)
+            else:
+                self.group.send_down_request(origin_floor, destination_floor)
+        except Exception as exc:  # one bad call must not take the worker, and every later call, down with it
+            self.errors.append((item, exc))
+            return
+        self.dispatch_latencies.append(time.monotonic() - submitted_at)
+
+    def run(self):
+        try:
+            self.serve()
+        except Exception as exc:
+            self.failure = exc
+
+    def serve(self):
+        simulation = self.group.simulation
+        while True:
+            simulation.run(until=self.virtual_now())
+            # sleep until the next car event is due or a call comes in, whichever is first
+            timeout = (simulation.events[0][0] - simulation.now) / self.speed if simulation.events else None
+            try:
+                item = self.inbox.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            while item is not None:
+                simulation.run(until=self.virtual_now())
+                self.handle(item)
+                try:
+                    item = self.inbox.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                return
 
 class Main:
     @staticmethod
     def main():
-        controller = Controller()
+        controller = Controller(Simulation(), Telemetry())  # as fast as possible; Simulation(realtime=True) to watch it live
 
         # up and down
         controller.send_up_request(1, 5)
@@ -106,13 +729,17 @@ class Main:
 
         # process requests
         controller.handle_requests()
+        print(controller.telemetry.snapshot(controller.simulation.now))
 
         print("New requests...")
         controller.send_up_request(1, 9)
         controller.send_down_request(5, 2)
+        controller.send_inside_request(7)
 
         # process new requests
         controller.handle_requests()
+        print(controller.passengers.report())
+        print(controller.telemetry.prometheus(controller.simulation.now), end="")
 
 if __name__ == "__main__":
     Main.main()
\ No newline at end of file
@@ -0,0 +1,421 @@
+import math
+import threading
+import time
+import unittest
+from unittest import mock
+from elevatorsystemclass import (Controller, ConstantTravelTime, DemandHistogram, Elevator, FixedDoorTime, GroupController,
+                                 KinematicTravelTime, ParkingPolicy, Request, RequestOrigin, Simulation, State,
+                                 Telemetry, ThreadedController)
+
+
+def without_sleeping(fn):
+    # real-time simulations sleep between events
+    with mock.patch("elevatorsystemclass.time.sleep"):
+        return fn()
+
+
+class TestElevatorSystem(unittest.TestCase):
+
+    def test_01_controller_picks_up_stops_on_the_way(self):
+        controller = Controller()
+        up = controller.send_up_request(1, 5)
+        down = controller.send_down_request(4, 2)
+        without_sleeping(controller.handle_requests)
+        # the down call at 4 is skipped on the way up and collected on the way back down
+        self.assertEqual(controller.elevator.current_floor, 2)
+        self.assertEqual(controller.elevator.floors_travelled, 4 + 1 + 2)
+        self.assertEqual(controller.elevator.state, State.IDLE)
+        passengers = controller.passengers
+        self.assertEqual((passengers.wait_time(up), passengers.ride_time(up)), (0.0, 5.0))
+        self.assertEqual((passengers.wait_time(down), passengers.ride_time(down)), (7.0, 3.0))
+
+    def test_02_idle_estimate_is_distance(self):
+        elevator = Elevator(current_floor=3)
+        self.assertEqual(elevator.estimate_arrival(8, State.UP, floor_time=2.0), 10.0)
+
+    def test_03_estimate_accounts_for_sweep_and_stops(self):
+        elevator = Elevator(current_floor=5)
+        elevator.state = State.UP
+        elevator.add_up_request(Request(RequestOrigin.OUTSIDE, 5, 10))
+        # ahead of the car in its direction: straight there, plus one pending stop
+        self.assertEqual(elevator.estimate_arrival(8, State.UP), 3 + 1)
+        # down call below: run up to 10, then back to 3
+        self.assertEqual(elevator.estimate_arrival(3, State.DOWN), 5 + 7 + 1)
+        # up call behind: up to 10, down to 2, then up to 2
+        self.assertEqual(elevator.estimate_arrival(2, State.UP), 5 + 8 + 0 + 1)
+
+    def test_04_group_sends_call_to_nearest_idle_car(self):
+        group = GroupController(3)
+        group.elevators[1].current_floor = 10
+        group.elevators[2].current_floor = 20
+        self.assertEqual(group.passengers.car[group.send_down_request(18, 1)], 2)
+        self.assertEqual(group.passengers.car[group.send_up_request(9, 12)], 1)
+
+    def test_05_group_spreads_load_over_busy_cars(self):
+        group = GroupController(2)
+        first = group.send_up_request(1, 20)
+        second = group.send_up_request(1, 15)
+        self.assertNotEqual(group.passengers.car[first], group.passengers.car[second])
+
+    def test_06_group_handle_requests_drains_every_car(self):
+        group = GroupController(2)
+        group.send_up_request(1, 5)
+        group.send_up_request(1, 7)
+        without_sleeping(group.handle_requests)
+        self.assertEqual(sorted(car.current_floor for car in group.elevators), [5, 7])
+        self.assertTrue(all(car.pending_stops() == 0 for car in group.elevators))
+        self.assertTrue(all(car.highest_stop is None for car in group.elevators))
+
+    def test_07_simulation_runs_events_in_time_order(self):
+        simulation = Simulation()
+        fired = []
+        simulation.schedule(5, fired.append, "late")
+        simulation.schedule(1, fired.append, "early")
+        simulation.schedule(1, fired.append, "early-second")
+        simulation.run(until=3)
+        self.assertEqual(fired, ["early", "early-second"])
+        self.assertEqual(simulation.now, 3)
+        simulation.run()
+        self.assertEqual(fired[-1], "late")
+        self.assertEqual(simulation.now, 5)
+
+    def test_08_virtual_clock_uses_travel_and_door_models(self):
+        simulation = Simulation()
+        elevator = Elevator(simulation=simulation, travel_time=ConstantTravelTime(2.0, start_stop_time=1.0),
+                            door_time=FixedDoorTime(3.0))
+        elevator.add_up_request(Request(RequestOrigin.INSIDE, 1, 6))
+        with mock.patch("elevatorsystemclass.time.sleep") as sleep:
+            simulation.run()
+        sleep.assert_not_called()
+        self.assertEqual(simulation.now, 1.0 + 5 * 2.0 + 3.0)
+        self.assertEqual(elevator.current_floor, 6)
+        self.assertEqual(elevator.state, State.IDLE)
+
+    def test_09_realtime_sleeps_scaled_gaps(self):
+        simulation = Simulation(realtime=True, speed=2.0)
+        simulation.schedule(4, lambda: None)
+        with mock.patch("elevatorsystemclass.time.sleep") as sleep:
+            simulation.run()
+        sleep.assert_called_once_with(2.0)
+
+    def test_10_kinematic_profile(self):
+        model = KinematicTravelTime(floor_height=4.0, max_speed=2.0, acceleration=1.0)
+        # 4 m of ramp-up and slow-down fits exactly in one floor
+        self.assertAlmostEqual(model(1, 2), 4.0)
+        self.assertAlmostEqual(model(1, 3), 4.0 + 4.0 / 2.0)
+        self.assertEqual(model(3, 3), 0.0)
+
+    def test_11_requests_join_a_running_sweep(self):
+        simulation = Simulation()
+        elevator = Elevator(simulation=simulation)
+        elevator.add_up_request(Request(RequestOrigin.OUTSIDE, 1, 10))
+        simulation.schedule(2, elevator.add_up_request, Request(RequestOrigin.OUTSIDE, 1, 12))
+        simulation.run()
+        self.assertEqual(elevator.current_floor, 12)
+        self.assertFalse(elevator.busy)
+
+    def visits(self, elevator):
+        floors = []
+        arrive = elevator.arrive
+
+        def recording(floor, leg):
+            if leg == elevator.leg:
+                floors.append(floor)
+            arrive(floor, leg)
+
+        elevator.arrive = recording
+        elevator.simulation.run()
+        return floors
+
+    def test_12_look_finishes_the_sweep_before_turning(self):
+        elevator = Elevator(current_floor=10, simulation=Simulation())
+        elevator.state = State.UP
+        for floor in (2, 12, 7, 15):
+            elevator.add_up_request(Request(RequestOrigin.INSIDE, 10, floor))
+        self.assertEqual(self.visits(elevator), [12, 15, 7, 2])
+        self.assertEqual(elevator.floors_travelled, 5 + 13)
+
+    def test_13_duplicate_stops_are_merged(self):
+        elevator = Elevator(simulation=Simulation())
+        for _ in range(3):
+            elevator.add_up_request(Request(RequestOrigin.OUTSIDE, 1, 6))
+        self.assertEqual(elevator.pending_stops(), 1)
+        self.assertEqual(self.visits(elevator), [1, 6])
+
+    def test_14_stop_passed_in_flight_is_served_on_the_way_back(self):
+        simulation = Simulation()
+        elevator = Elevator(simulation=simulation, travel_time=ConstantTravelTime(1.0))
+        elevator.add_up_request(Request(RequestOrigin.INSIDE, 1, 10))
+        # the car leaves floor 1 at t=0 and is already past floor 3 when it is requested
+        simulation.schedule(3.5, elevator.add_up_request, Request(RequestOrigin.INSIDE, 1, 3))
+        self.assertEqual(self.visits(elevator), [10, 3])
+
+    def test_15_inside_request_rides_from_current_floor(self):
+        controller = Controller(Simulation())
+        controller.elevator.current_floor = 3
+        passenger = controller.send_inside_request(8)
+        controller.handle_requests()
+        passengers = controller.passengers
+        self.assertEqual((passengers.origin[passenger], passengers.destination[passenger]), (3, 8))
+        self.assertEqual(passengers.wait_time(passenger), 0.0)
+        self.assertEqual(passengers.ride_time(passenger), 5.0)
+
+    def test_16_hall_call_in_the_other_direction_waits_for_its_sweep(self):
+        simulation = Simulation()
+        elevator = Elevator(current_floor=1, simulation=simulation)
+        elevator.add_request(Request(RequestOrigin.INSIDE, 1, 10))
+        down = elevator.add_request(Request(RequestOrigin.OUTSIDE, 5, 2))
+        up = elevator.add_request(Request(RequestOrigin.OUTSIDE, 6, 8))
+        self.assertEqual(self.visits(elevator), [6, 8, 10, 5, 2])
+        passengers = elevator.passengers
+        self.assertLess(passengers.picked_up_at[up], passengers.picked_up_at[down])
+        self.assertFalse(math.isnan(passengers.dropped_off_at[up]))
+
+    def test_17_report_covers_served_passengers_only(self):
+        group = GroupController(2, simulation=Simulation())
+        for origin, destination in ((1, 9), (9, 1), (4, 6)):
+            send = group.send_up_request if destination > origin else group.send_down_request
+            send(origin, destination)
+        group.simulation.run(until=1.5)
+        partial = group.passengers.report()
+        self.assertEqual(partial["passengers"], 3)
+        self.assertLess(partial["delivered"], 3)
+        group.handle_requests()
+        report = group.passengers.report()
+        self.assertEqual((report["picked_up"], report["delivered"]), (3, 3))
+        self.assertGreater(report["average_ride"], 0)
+
+    def test_18_threaded_controller_accepts_calls_from_many_threads(self):
+        group = GroupController(4, simulation=Simulation())
+        controller = ThreadedController(group, speed=1000).start()
+
+        def caller(offset):
+            for i in range(50):
+                controller.submit(1 + (i + offset) % 20, 21 + i % 10)
+
+        threads = [threading.Thread(target=caller, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        controller.submit_inside(0, 30)
+        controller.stop()
+        report = group.passengers.report()
+        self.assertEqual((report["passengers"], report["delivered"]), (201, 201))
+        self.assertEqual(len(controller.dispatch_latencies), 201)
+
+    def test_19_submit_does_not_wait_for_the_worker(self):
+        group = GroupController(1, simulation=Simulation())
+        controller = ThreadedController(group)
+        # worker not started: nothing can consume the queue, yet submit still returns
+        start = time.perf_counter()
+        for i in range(1_000):
+            controller.submit(1, 2 + i % 10)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(len(group.passengers), 0)
+
+    def test_20_calls_join_the_running_sweep_in_virtual_time(self):
+        group = GroupController(1, simulation=Simulation())
+        controller = ThreadedController(group, speed=50).start()
+        controller.submit(1, 40)
+        time.sleep(0.2)  # ~10 virtual seconds: the car is on its way up
+        controller.submit(30, 35)
+        controller.stop()
+        passengers = group.passengers
+        # picked up on the way to 40 and dropped before it, not after a return trip
+        self.assertLess(passengers.dropped_off_at[1], passengers.dropped_off_at[0])
+
+    def test_21_threaded_controller_rejects_realtime_simulation(self):
+        with self.assertRaises(ValueError):
+            ThreadedController(GroupController(1))
+
+    def test_22_stop_ahead_in_flight_shortens_the_leg(self):
+        simulation = Simulation()
+        elevator = Elevator(simulation=simulation, travel_time=ConstantTravelTime(1.0))
+        elevator.add_up_request(Request(RequestOrigin.INSIDE, 1, 10))
+        simulation.schedule(3.5, elevator.add_up_request, Request(RequestOrigin.INSIDE, 1, 7))
+        simulation.schedule(4, elevator.add_up_request, Request(RequestOrigin.INSIDE, 1, 7))
+        self.assertEqual(self.visits(elevator), [7, 10])
+        self.assertEqual(elevator.floors_travelled, 9)
+        # arrived at 7 after 6s of travel, not 3.5s + a fresh 6s leg
+        self.assertEqual(simulation.now, 6 + 1 + 3 + 1)
+
+    def test_23_histogram_buckets_by_time_of_day_and_decays(self):
+        histogram = DemandHistogram(10, bucket_seconds=3600, half_life=86400)
+        histogram.record(1, 8 * 3600)
+        histogram.record(1, 8 * 3600 + 60)
+        # the same hour on the next day sees yesterday's calls at half weight
+        self.assertAlmostEqual(histogram.weight(1, 86400 + 8 * 3600 + 60), 1.0, places=3)
+        self.assertEqual(histogram.weight(1, 9 * 3600), 0.0)
+        self.assertEqual(histogram.weight(2, 8 * 3600), 0.0)
+
+    def test_24_policy_ranks_floors_for_now_and_the_next_bucket(self):
+        policy = ParkingPolicy(20, bucket_seconds=3600)
+        for _ in range(5):
+            policy.record(1, 8 * 3600 + 10)
+        for _ in range(3):
+            policy.record(15, 7 * 3600 + 10)
+        policy.record(9, 7 * 3600 + 20)
+        # at 07:30, floor 1's 08:00 demand already counts
+        self.assertEqual(policy.ranked_floors(7 * 3600 + 1800, 2), [1, 15])
+        self.assertEqual(policy.ranked_floors(3 * 3600, 2), [])
+
+    def test_25_idle_cars_park_at_learned_floors_without_opening_doors(self):
+        simulation = Simulation()
+        policy = ParkingPolicy(20, bucket_seconds=3600)
+        for _ in range(5):
+            policy.record(1, 10)
+        for _ in range(3):
+            policy.record(12, 10)
+        group = GroupController(2, simulation=simulation, parking=policy, start_floor=8)
+        group.elevators[0].park(group.elevators[0].current_floor)  # no-op: already there
+        for elevator in group.elevators:
+            group.park(elevator)
+        simulation.run()
+        self.assertEqual(sorted(car.current_floor for car in group.elevators), [1, 12])
+        self.assertEqual(simulation.now, 7.0)  # 8 -> 1 with no door cycle
+        self.assertTrue(all(car.state == State.IDLE and not car.busy for car in group.elevators))
+
+    def test_26_group_learns_from_hall_calls_and_parks_after_serving(self):
+        simulation = Simulation()
+        group = GroupController(1, simulation=simulation, parking=ParkingPolicy(20))
+        for at in range(0, 600, 60):
+            simulation.schedule_at(at, group.send_up_request, 1, 5)
+        simulation.schedule_at(700, group.send_down_request, 10, 9)
+        simulation.run()
+        # after the last trip ends on 9, the car returns to the lobby where most calls start
+        self.assertEqual(group.elevators[0].current_floor, 1)
+        self.assertEqual(group.passengers.report()["delivered"], 11)
+
+    def test_27_telemetry_counts_stops_floors_doors_and_passenger_times(self):
+        telemetry = Telemetry(num_cars=1)
+        controller = Controller(Simulation(), telemetry)
+        controller.send_up_request(1, 5)
+        controller.send_down_request(4, 2)
+        controller.handle_requests()
+        snapshot = telemetry.snapshot(controller.simulation.now)
+        self.assertEqual(snapshot["stops"], [4])
+        self.assertEqual(snapshot["door_cycles"], [4])
+        self.assertEqual(snapshot["floors_travelled"], [controller.elevator.floors_travelled])
+        self.assertEqual(snapshot["utilization"], [1.0])
+        # waits 0s and 7s, rides 5s and 3s
+        self.assertEqual((snapshot["wait_seconds"]["count"], snapshot["wait_seconds"]["sum"]), (2, 7.0))
+        self.assertEqual(snapshot["wait_seconds"]["buckets"][5], 1)
+        self.assertEqual(snapshot["ride_seconds"]["buckets"][5], 2)
+        self.assertEqual(snapshot["ride_seconds"]["buckets"]["+Inf"], 2)
+
+    def test_28_utilization_counts_idle_time(self):
+        simulation = Simulation()
+        telemetry = Telemetry(num_cars=2)
+        group = GroupController(2, simulation=simulation, telemetry=telemetry)
+        group.send_inside_request(0, 5)  # 4 floors + 1s of doors
+        simulation.run(until=10)
+        self.assertEqual(telemetry.utilization(10), [0.5, 0.0])
+
+    def test_29_prometheus_text(self):
+        telemetry = Telemetry(num_cars=2, bounds=(10, 60))
+        telemetry.stop(1, 3)
+        telemetry.wait.observe(12)
+        text = telemetry.prometheus(now=0)
+        self.assertIn("# TYPE elevator_stops_total counter\n", text)
+        self.assertIn('elevator_floors_travelled_total{car="1"} 3\n', text)
+        self.assertIn('elevator_wait_seconds_bucket{le="10"} 0\n', text)
+        self.assertIn('elevator_wait_seconds_bucket{le="60"} 1\n', text)
+        self.assertIn('elevator_wait_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn("elevator_wait_seconds_count 1\n", text)
+        self.assertTrue(text.endswith("\n"))
+
+    def test_30_telemetry_is_off_by_default(self):
+        controller = Controller(Simulation())
+        controller.send_up_request(1, 3)
+        controller.handle_requests()
+        self.assertIsNone(controller.elevator.telemetry)
+        self.assertEqual(controller.passengers.report()["delivered"], 1)
+
+    def test_31_car_on_its_last_leg_is_not_treated_as_idle(self):
+        simulation = Simulation()
+        group = GroupController(2, simulation=simulation)
+        group.elevators[1].current_floor = 3
+        rider = group.send_up_request(1, 20)
+        self.assertEqual(group.passengers.car[rider], 0)
+        simulation.run(until=5)  # car 0 boarded and is on its way to 20
+        car = group.elevators[0]
+        self.assertEqual(car.target, 20)
+        self.assertEqual(car.pending_stops(), 1)
+        self.assertEqual(car.position(), 5)
+        caller = group.send_down_request(2, 1)
+        self.assertEqual(group.passengers.car[caller], 1)
+        simulation.run()
+        self.assertEqual(group.passengers.wait_time(caller), 1.0)
+
+    def test_32_group_sizes_default_telemetry(self):
+        simulation = Simulation()
+        telemetry = Telemetry()
+        group = GroupController(4, simulation=simulation, telemetry=telemetry)
+        for car in group.elevators[1:]:
+            car.current_floor = 10
+        group.send_up_request(9, 12)
+        simulation.run()
+        self.assertEqual(len(telemetry.stops), 4)
+        self.assertEqual(telemetry.door_cycles[0], 0)
+        self.assertEqual(sum(telemetry.door_cycles), 2)
+        self.assertEqual(len(telemetry.utilization(simulation.now)), 4)
+
+    def test_33_depart_closes_doors(self):
+        closed = []
+        controller = Controller(Simulation())
+        controller.elevator.close_doors = lambda: closed.append(controller.elevator.current_floor)
+        controller.send_up_request(2, 4)
+        controller.handle_requests()
+        self.assertEqual(closed, [2, 4])
+
+    def test_34_histogram_rejects_floors_out_of_range(self):
+        histogram = DemandHistogram(10, bucket_seconds=3600)
+        for floor in (0, 12, -1):
+            with self.assertRaises(ValueError):
+                histogram.record(floor, 8 * 3600)
+        histogram.record(10, 8 * 3600)
+        self.assertEqual(histogram.weight(10, 8 * 3600), 1.0)
+        self.assertEqual(histogram.weight(1, 9 * 3600), 0.0)  # 12 used to land on floor 1 of the next hour
+
+    def test_35_bad_call_does_not_kill_the_worker(self):
+        group = GroupController(2, simulation=Simulation())
+        controller = ThreadedController(group, speed=1000).start()
+        controller.submit(None, 5)
+        controller.submit_inside(7, 5)  # no such car
+        controller.submit(1, 5)
+        controller.stop()
+        self.assertEqual([item[2:] for item, _ in controller.errors], [(None, 5), (None, 5)])
+        self.assertEqual(group.passengers.report()["delivered"], 1)
+
+    def test_36_stop_reports_a_dead_worker(self):
+        group = GroupController(1, simulation=Simulation())
+        controller = ThreadedController(group, speed=1000)
+
+        def crash(until=None):
+            raise ZeroDivisionError("boom")
+
+        group.simulation.run = crash
+        controller.start()
+        controller.submit(1, 5)
+        with self.assertRaises(Exception) as raised:
+            controller.stop()
+        self.assertIsInstance(raised.exception.__cause__, ZeroDivisionError)
+
+    def test_37_parking_legs_count_floors_but_not_stops(self):
+        simulation = Simulation()
+        telemetry = Telemetry(num_cars=1)
+        policy = ParkingPolicy(20, bucket_seconds=3600)
+        policy.record(12, 10)
+        group = GroupController(1, simulation=simulation, parking=policy, telemetry=telemetry, start_floor=8)
+        group.park(group.elevators[0])
+        simulation.run()
+        snapshot = telemetry.snapshot(simulation.now)
+        self.assertEqual(group.elevators[0].current_floor, 12)
+        self.assertEqual(snapshot["stops"], [0])
+        self.assertEqual(snapshot["door_cycles"], [0])
+        self.assertEqual(snapshot["floors_travelled"], [4])
+
+
+if __name__ == "__main__":
+    unittest.main()
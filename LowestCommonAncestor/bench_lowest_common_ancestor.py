@@ -0,0 +1,46 @@
+# Benchmarks for the org-chart LCA
+# Run: python bench_lowest_common_ancestor.py
+
+import random
+import sys
+import time
+from lowestcommonancestorclass import Employee, LCAIndex, find_lca
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+# each employee reports to a random earlier one, biased towards recent hires so the chart has depth
+def org_chart(size, seed=3):
+    rng = random.Random(seed)
+    employees = [Employee(f"E{i}") for i in range(size)]
+    for i in range(1, size):
+        employees[max(0, i - 1 - int(rng.expovariate(1 / 50)))].add_subordinate(employees[i])
+    return employees
+
+def bench_lca(size=500_000):
+    print(f"== LCA on a {size:,}-employee org chart ==")
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100_000))  # find_lca recurses once per level
+    employees = org_chart(size)
+    root = employees[0]
+    rng = random.Random(9)
+    index, build = timed(lambda: LCAIndex(root))
+    # container sizes only; tracemalloc slows the build down too much to run under it
+    table = sum(sys.getsizeof(row) for row in index.table)
+    lookup = sys.getsizeof(index.tin) + sys.getsizeof(index.order)
+    print(f"LCAIndex build: {build:.2f}s, sparse table {table / 2**20:.0f} MiB over {len(index.table)} levels, "
+          f"tin dict + order list {lookup / 2**20:.0f} MiB")
+
+    pairs = [(rng.choice(employees), rng.choice(employees)) for _ in range(20)]
+    answers, elapsed = timed(lambda: [find_lca(root, a, b) for a, b in pairs])
+    print(f"find_lca:       {elapsed / len(pairs) * 1e6:12,.1f} us/query")
+
+    pairs_many = [(rng.choice(employees), rng.choice(employees)) for _ in range(1_000_000)]
+    _, elapsed_index = timed(lambda: [index.find_lca(a, b) for a, b in pairs_many])
+    print(f"LCAIndex:       {elapsed_index / len(pairs_many) * 1e6:12,.1f} us/query "
+          f"({elapsed / len(pairs) / (elapsed_index / len(pairs_many)):,.0f}x faster)")
+    assert answers == [index.find_lca(a, b) for a, b in pairs]
+
+if __name__ == "__main__":
+    bench_lca()
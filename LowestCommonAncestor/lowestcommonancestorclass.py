@@ -2,6 +2,8 @@
 # Problem: Find the lowest common manager in a company org chart.
 # Concepts: N-ary tree traversal, recursive DFS
 
+from array import array
+
 class Employee:
     def __init__(self, name):
         self.name = name
@@ -27,6 +29,52 @@ def find_lca(root, emp1, emp2):
 
     return temp
 
+# Preprocessed index for many queries against the same chart: O(n log n) build, O(1) per query.
+# Employees are numbered in DFS order (tin). For u before v in that order, every employee in
+# positions (tin[u], tin[v]] sits under the LCA, and the LCA's child on the way to v is among
+# them, so the LCA is the manager with the smallest tin over that range: a range-minimum query
+# over "tin of my manager", answered from a sparse table of typed arrays.
+# The index is a snapshot; rebuild it after the chart changes.
+class LCAIndex:
+    def __init__(self, root):
+        self.order = []  # employees in DFS order
+        self.tin = {}  # employee -> position in order
+        manager_tin = array('i')
+        stack = [(root, 0)]
+        while stack:  # iterative, org charts can be deeper than the recursion limit
+            emp, parent = stack.pop()
+            self.tin[emp] = len(self.order)
+            self.order.append(emp)
+            manager_tin.append(parent)
+            position = len(self.order) - 1
+            for sub in reversed(emp.subordinates):
+                stack.append((sub, position))
+        # table[k][i] = min(manager_tin[i : i + 2**k])
+        self.table = [manager_tin]
+        step = 1
+        while 2 * step <= len(manager_tin):
+            prev = self.table[-1]
+            self.table.append(array('i', [a if a < b else b for a, b in zip(prev, prev[step:])]))
+            step *= 2
+
+    def __len__(self):
+        return len(self.order)
+
+    # None if either employee is not in the indexed chart
+    def find_lca(self, emp1, emp2):
+        u, v = self.tin.get(emp1), self.tin.get(emp2)
+        if u is None or v is None:
+            return None
+        if u == v:
+            return emp1
+        if u > v:
+            u, v = v, u
+        u += 1
+        k = (v - u + 1).bit_length() - 1
+        row = self.table[k]
+        a, b = row[u], row[v - (1 << k) + 1]
+        return self.order[a if a < b else b]
+
 # Example usage
 if __name__ == "__main__":
     # Create organization structure
@@ -76,4 +124,10 @@ if __name__ == "__main__":
 
     print("\nFinding LCA of Engineer 1 and Salesperson 1:")
     lca = find_lca(ceo, engineer1, salesperson1)
-    print(f"LCA: {lca.name if lca else 'None'}")  # Should be CEO
\ No newline at end of file
+    print(f"LCA: {lca.name if lca else 'None'}")  # Should be CEO
+
+    # Many queries on the same chart: build the index once
+    index = LCAIndex(ceo)
+    print("\nIndexed queries:")
+    for emp1, emp2 in ((engineer1, engineer2), (engineer1, engineer3), (engineer1, salesperson1), (engineer4, vp_eng)):
+        print(f"{emp1.name} + {emp2.name}: {index.find_lca(emp1, emp2).name}")
\ No newline at end of file
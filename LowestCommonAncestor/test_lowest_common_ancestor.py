@@ -0,0 +1,70 @@
+import itertools
+import random
+import unittest
+from lowestcommonancestorclass import Employee, LCAIndex, find_lca
+
+
+def random_chart(size, seed):
+    rng = random.Random(seed)
+    employees = [Employee(f"E{i}") for i in range(size)]
+    for i in range(1, size):
+        employees[rng.randrange(i)].add_subordinate(employees[i])
+    return employees
+
+
+class TestLowestCommonAncestor(unittest.TestCase):
+
+    def setUp(self):
+        self.ceo = Employee("CEO")
+        self.vp_eng = Employee("VP Engineering")
+        self.vp_sales = Employee("VP Sales")
+        self.manager = Employee("Engineering Manager")
+        self.engineer1 = Employee("Engineer 1")
+        self.engineer2 = Employee("Engineer 2")
+        self.salesperson = Employee("Salesperson")
+        self.ceo.add_subordinate(self.vp_eng)
+        self.ceo.add_subordinate(self.vp_sales)
+        self.vp_eng.add_subordinate(self.manager)
+        self.manager.add_subordinate(self.engineer1)
+        self.manager.add_subordinate(self.engineer2)
+        self.vp_sales.add_subordinate(self.salesperson)
+
+    def test_01_find_lca(self):
+        self.assertIs(find_lca(self.ceo, self.engineer1, self.engineer2), self.manager)
+        self.assertIs(find_lca(self.ceo, self.engineer1, self.salesperson), self.ceo)
+        self.assertIs(find_lca(self.ceo, self.engineer2, self.vp_eng), self.vp_eng)
+
+    def test_02_index_matches_find_lca_on_every_pair(self):
+        index = LCAIndex(self.ceo)
+        employees = list(index.order)
+        self.assertEqual(len(index), 7)
+        for emp1, emp2 in itertools.product(employees, repeat=2):
+            self.assertIs(index.find_lca(emp1, emp2), find_lca(self.ceo, emp1, emp2))
+
+    def test_03_index_matches_find_lca_on_random_charts(self):
+        for seed in range(5):
+            employees = random_chart(300, seed)
+            index = LCAIndex(employees[0])
+            rng = random.Random(seed)
+            for _ in range(300):
+                emp1, emp2 = rng.choice(employees), rng.choice(employees)
+                self.assertIs(index.find_lca(emp1, emp2), find_lca(employees[0], emp1, emp2))
+
+    def test_04_index_handles_charts_deeper_than_the_recursion_limit(self):
+        chain = [Employee(f"L{i}") for i in range(50_000)]
+        for manager, report in zip(chain, chain[1:]):
+            manager.add_subordinate(report)
+        side = Employee("Side")
+        chain[1_000].add_subordinate(side)
+        index = LCAIndex(chain[0])
+        self.assertIs(index.find_lca(chain[-1], side), chain[1_000])
+        self.assertIs(index.find_lca(chain[-1], chain[20_000]), chain[20_000])
+
+    def test_05_unknown_employee(self):
+        index = LCAIndex(self.ceo)
+        self.assertIsNone(index.find_lca(self.engineer1, Employee("Contractor")))
+        self.assertIs(index.find_lca(self.ceo, self.ceo), self.ceo)
+
+
+if __name__ == "__main__":
+    unittest.main()